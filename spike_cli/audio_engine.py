@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from typing import Callable, Optional
+import sounddevice as sd
+
+class DuplexAudioEngine:
+    """
+    One full-duplex sounddevice stream serving both capture (Recorder) and
+    playback (Player). The device is opened once per call; pausing capture or
+    starting playback only flips a flag or appends to a buffer, so switching
+    turns costs no device open/close.
+
+    Buffers are collections.deque, whose append/popleft are atomic, so the
+    audio callback never waits on a lock. Input and output share one sample
+    clock (`frames`), advanced by the callback.
+    """
+    def __init__(self, samplerate=16000, channels=1, blocksize=480, latency="low", device=None):
+        """
+        samplerate: samples per second, for both directions
+        blocksize: frames per callback (must be > 0; 480 = 30 ms at 16 kHz)
+        latency: PortAudio latency hint ("low", "high" or seconds)
+        device: sounddevice device spec, or None for the default pair
+        """
+        if blocksize <= 0:
+            raise ValueError("blocksize must be a positive number of frames")
+        self.samplerate  = samplerate
+        self.channels    = channels
+        self.blocksize   = blocksize
+        self.latency     = latency
+        self.device      = device
+        self.block_bytes = blocksize * channels * 2  # int16
+        self.frames      = 0      # shared clock, in samples per channel
+        self.xruns       = 0
+        self.capturing   = True
+        self._silence    = bytes(self.block_bytes)
+        self._input_handler: Optional[Callable[[bytes], None]] = None
+        self._out = deque()       # block-sized chunks waiting for the device
+        self._pending = b""       # writer-side remainder smaller than a block
+        self._blocks_written = 0  # only touched by the writer
+        self._blocks_played  = 0  # only touched by the callback
+        self._stream = None
+
+    def start(self):
+        """
+        Open and start the duplex stream (no-op if already running).
+        """
+        if self._stream:
+            return
+        self._stream = sd.RawStream(
+            samplerate=self.samplerate,
+            blocksize=self.blocksize,
+            channels=self.channels,
+            dtype='int16',
+            latency=self.latency,
+            device=self.device,
+            callback=self._callback
+        )
+        self._stream.start()
+
+    def close(self):
+        """
+        Stop and close the stream.
+        """
+        stream, self._stream = self._stream, None
+        if stream:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception:
+                pass
+
+    def clock(self) -> float:
+        """
+        Seconds of audio the stream has processed, shared by input and output.
+        """
+        return self.frames / self.samplerate
+
+    def set_input_handler(self, handler: Optional[Callable[[bytes], None]]):
+        """
+        handler is called from the audio thread with each captured block.
+        """
+        self._input_handler = handler
+
+    def write(self, pcm: bytes, final: bool = False):
+        """
+        Queue PCM for playback without blocking. Leftovers smaller than a block
+        are held until the next write, or padded with silence when final.
+        Assumes a single writer thread.
+        """
+        data = self._pending + pcm
+        n = self.block_bytes
+        full = len(data) - len(data) % n
+        for off in range(0, full, n):
+            self._out.append(data[off:off + n])
+        self._blocks_written += full // n
+        self._pending = data[full:]
+        if final and self._pending:
+            self._out.append(self._pending + self._silence[len(self._pending):])
+            self._blocks_written += 1
+            self._pending = b""
+
+    def play(self, pcm: bytes, margin: float = 2.0):
+        """
+        Queue PCM and block until it has been played out. Raises RuntimeError
+        if the stream stops, or if playback takes `margin` seconds longer than
+        the queued audio (the device stopped calling back).
+        """
+        self.start()
+        self.write(pcm, final=True)
+        target = self._blocks_written
+        tick = self.blocksize / self.samplerate
+        deadline = time.monotonic() + (target - self._blocks_played) * tick + margin
+        while self._stream and self._blocks_played < target:
+            if not self._stream.active:
+                self._drop_output()
+                raise RuntimeError("audio stream stopped during playback")
+            if time.monotonic() > deadline:
+                self._drop_output()
+                raise RuntimeError("audio playback stalled: device stopped calling back")
+            time.sleep(tick)
+        # last block handed to the device; let it drain through the output latency
+        if self._stream:
+            time.sleep(self._stream.latency[1])
+
+    def _drop_output(self):
+        """
+        Discard queued playback so the next play() doesn't wait on it.
+        """
+        self._out.clear()
+        self._pending = b""
+        self._blocks_written = self._blocks_played
+
+    def _callback(self, indata, outdata, frames, time_info, status):
+        """
+        Audio-thread callback: hand input to the handler, feed queued output.
+        """
+        if status:
+            self.xruns += 1
+        handler = self._input_handler
+        if handler and self.capturing:
+            handler(bytes(indata))
+        try:
+            outdata[:] = self._out.popleft()
+            self._blocks_played += 1
+        except IndexError:
+            outdata[:] = self._silence
+        self.frames += frames
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+def history_key(model: str, messages: List[dict]) -> str:
+    """
+    Hash of (model, conversation) with whitespace normalized, so cosmetic
+    differences in the prompt template don't miss the cache.
+    """
+    norm = [[m["role"], " ".join((m.get("content") or "").split())] for m in messages]
+    blob = json.dumps([model, norm], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def audio_key(text: str, *params) -> str:
+    """
+    Hash of the spoken text plus whatever voice parameters shape the audio.
+    """
+    blob = json.dumps([" ".join(text.split()), *map(str, params)], ensure_ascii=False)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+class ResponseCache:
+    """
+    Thread-safe LRU of bytes values, optionally backed by a directory so that
+    entries survive restarts and can be rendered ahead of time
+    (see spike_cli.precompute).
+    """
+    def __init__(self, max_entries: int = 256, directory: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.directory   = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.hits   = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock  = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict, namespace: str) -> "ResponseCache":
+        cfg  = config.get("cache") or {}
+        root = cfg.get("dir")
+        if root:
+            # relative paths are relative to the project root, like config.yml
+            root = Path(__file__).parent.parent / root
+        return cls(
+            max_entries=cfg.get("max_entries", 256),
+            directory=root / namespace if root else None,
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+        if value is None and self.directory:
+            path = self.directory / f"{key}.bin"
+            if path.exists():
+                value = path.read_bytes()
+                self._remember(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        self._remember(key, value)
+        if self.directory:
+            # unique temp name: server workers, prefetch and the precompute
+            # CLI may all write the same key into one cache.dir
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False
+            ) as tmp:
+                tmp.write(value)
+            Path(tmp.name).replace(self.directory / f"{key}.bin")
+
+    def _remember(self, key: str, value: bytes):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
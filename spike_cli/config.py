@@ -0,0 +1,17 @@
+from pathlib import Path
+import yaml
+
+def load_config():
+    cfg_path = Path(__file__).parent.parent / "config.yml"
+    return yaml.safe_load(cfg_path.read_text())
+
+PATIENT_FIELDS = ("member_id", "patient_name", "date_of_birth")
+
+def with_patient(config: dict, patient: dict) -> dict:
+    """
+    Copy of config with the known patient fields overridden by `patient`.
+    """
+    overrides = {k: patient[k] for k in PATIENT_FIELDS if patient.get(k)}
+    if not overrides:
+        return config
+    return {**config, "patient": {**config["patient"], **overrides}}
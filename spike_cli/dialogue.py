@@ -0,0 +1,12 @@
+FAREWELLS  = ("goodbye", "have a great day", "thank you for your time")
+APOLOGY    = (
+    "I’m sorry, it seems something went wrong on our side. "
+    "I will make sure to call you back as soon as we have everything fixed. Goodbye."
+)
+
+def is_farewell(text: str) -> bool:
+    """
+    True if the assistant's reply closes the call.
+    """
+    low = text.lower()
+    return any(f in low for f in FAREWELLS)
@@ -0,0 +1,346 @@
+"""
+Shared-memory DSP worker pool for running many calls in one process.
+
+Each call gets two byte rings in multiprocessing.shared_memory: the caller
+writes inbound PCM into the input ring, a worker process runs VAD
+segmentation and WAV encoding, and writes finished utterances into the
+output ring. Only small descriptors cross the process boundary
+(("data", call_id, write_pos) in, ("utterance", call_id, start, length)
+out), so audio is never pickled and the CPU-bound work runs outside the
+caller's GIL. Calls are sharded onto the least-loaded worker. A worker
+that dies is respawned and its calls are reopened on the new process.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional
+
+import webrtcvad
+
+from spike_cli.vad import UtteranceSegmenter
+from spike_cli.wav import encode_wav
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # 3.13+: the creating process owns cleanup
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+class ShmRing:
+    """
+    Byte ring over a shared memory block. Positions are absolute byte counts
+    that only grow; the ring keeps the last `capacity` bytes.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int):
+        self.shm      = shm
+        self.capacity = capacity
+        self.buf      = shm.buf
+
+    def write(self, pos: int, data: bytes):
+        cap = self.capacity
+        if len(data) > cap:
+            pos, data = pos + len(data) - cap, data[-cap:]
+        off = pos % cap
+        first = min(len(data), cap - off)
+        self.buf[off:off + first] = data[:first]
+        if first < len(data):
+            self.buf[:len(data) - first] = data[first:]
+
+    def read(self, start: int, end: int) -> bytes:
+        cap = self.capacity
+        off = start % cap
+        n = end - start
+        first = min(n, cap - off)
+        if first == n:
+            return bytes(self.buf[off:off + n])
+        return bytes(self.buf[off:cap]) + bytes(self.buf[:n - first])
+
+    def release(self):
+        self.buf = None
+        self.shm.close()
+
+class _WorkerCall:
+    """Per-call state inside a worker process."""
+    def __init__(self, in_ring, out_ring, segmenter, sample_rate, read_pos=0, out_pos=0):
+        self.in_ring   = in_ring
+        self.out_ring  = out_ring
+        self.segmenter = segmenter
+        self.sample_rate = sample_rate
+        self.read_pos  = read_pos
+        self.out_pos   = out_pos
+
+def _worker_main(tasks: mp.Queue, results: mp.Queue, vad_factory):
+    """
+    Worker process loop: segment and encode audio for the calls assigned to it.
+    """
+    calls: Dict[int, _WorkerCall] = {}
+    while True:
+        msg = tasks.get()
+        kind = msg[0]
+        if kind == "data":
+            _, call_id, write_pos = msg
+            call = calls.get(call_id)
+            if not call:
+                continue
+            ring = call.in_ring
+            if write_pos - call.read_pos > ring.capacity:
+                results.put(("overrun", call_id, write_pos - ring.capacity - call.read_pos))
+                call.read_pos = write_pos - ring.capacity
+            pcm = ring.read(call.read_pos, write_pos)
+            call.read_pos = write_pos
+            for utt in call.segmenter.feed(pcm):
+                wav = encode_wav(utt, call.sample_rate)
+                if len(wav) > call.out_ring.capacity:
+                    results.put(("overrun", call_id, len(wav)))
+                    continue
+                call.out_ring.write(call.out_pos, wav)
+                results.put(("utterance", call_id, call.out_pos, len(wav)))
+                call.out_pos += len(wav)
+        elif kind == "open":
+            (_, call_id, in_name, in_cap, out_name, out_cap,
+             sample_rate, frame_duration, aggressiveness, read_pos, out_pos) = msg
+            segmenter = UtteranceSegmenter(
+                vad_factory(aggressiveness), samplerate=sample_rate, frame_duration=frame_duration
+            )
+            calls[call_id] = _WorkerCall(
+                ShmRing(_attach(in_name), in_cap), ShmRing(_attach(out_name), out_cap),
+                segmenter, sample_rate, read_pos, out_pos
+            )
+        elif kind == "close":
+            call = calls.pop(msg[1], None)
+            if call:
+                call.in_ring.release()
+                call.out_ring.release()
+            results.put(("closed", msg[1]))
+        elif kind == "stop":
+            for call in calls.values():
+                call.in_ring.release()
+                call.out_ring.release()
+            return
+
+class CallHandle:
+    """
+    Caller-side end of one call: write inbound PCM, receive WAV utterances
+    through the callback given to DSPPool.open_call.
+    """
+    def __init__(self, pool: "DSPPool", call_id: int, worker: int,
+                 in_ring: ShmRing, out_ring: ShmRing, on_utterance, notify_bytes: int):
+        self.pool     = pool
+        self.call_id  = call_id
+        self.worker   = worker
+        self.in_ring  = in_ring
+        self.out_ring = out_ring
+        self.on_utterance = on_utterance
+        self.notify_bytes = notify_bytes
+        self.open_args = ()   # (samplerate, frame_duration, aggressiveness)
+        self.write_pos = 0
+        self.out_end   = 0    # end of the last utterance read from out_ring
+        self._notified = 0
+        self.closed    = False
+
+    def write(self, pcm: bytes):
+        """
+        Append inbound PCM; the worker is only poked once enough has built up.
+        """
+        if self.closed:
+            return
+        self.in_ring.write(self.write_pos, pcm)
+        self.write_pos += len(pcm)
+        if self.write_pos - self._notified >= self.notify_bytes:
+            self._notified = self.write_pos
+            # through the pool lock: a respawn may be swapping this worker's queue
+            self.pool._send(self.worker, ("data", self.call_id, self.write_pos))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pool._send(self.worker, ("close", self.call_id))
+
+    def _unlink(self):
+        for ring in (self.in_ring, self.out_ring):
+            shm = ring.shm
+            ring.release()
+            shm.unlink()
+
+class DSPPool:
+    """
+    Pool of DSP worker processes shared by all calls in this process.
+
+        pool = DSPPool(workers=4); pool.start()
+        call = pool.open_call(on_utterance, loop=asyncio.get_running_loop())
+        call.write(pcm) ...; call.close()
+        pool.close()
+
+    on_utterance(wav_bytes) runs on the pool's result thread, or on `loop`
+    (via call_soon_threadsafe) when one is given.
+    """
+    def __init__(self, workers: Optional[int] = None, in_seconds: float = 10,
+                 out_seconds: float = 60, notify_ms: int = 90, vad_factory=webrtcvad.Vad,
+                 check_s: float = 0.5):
+        self.workers     = workers or os.cpu_count() or 1
+        self.in_seconds  = in_seconds
+        self.out_seconds = out_seconds
+        self.notify_ms   = notify_ms
+        self.vad_factory = vad_factory
+        self.check_s     = check_s   # how often worker liveness is checked
+        self.utterances  = 0
+        self.overruns    = 0
+        self._ctx     = mp.get_context("spawn")
+        self._tasks   = []
+        self._procs   = []
+        self._results = None
+        self._calls: Dict[int, CallHandle] = {}
+        self._load    = [0] * self.workers
+        self._ids     = itertools.count(1)
+        self._lock    = threading.Lock()
+        self._thread  = None
+        self._closing = False
+        self.restarts = 0
+
+    def _spawn(self):
+        tasks = self._ctx.Queue()
+        p = self._ctx.Process(
+            target=_worker_main, args=(tasks, self._results, self.vad_factory), daemon=True
+        )
+        p.start()
+        return tasks, p
+
+    def _send(self, worker: int, msg: tuple):
+        with self._lock:
+            self._tasks[worker].put(msg)
+
+    def _open_msg(self, handle: CallHandle) -> tuple:
+        return ("open", handle.call_id, handle.in_ring.shm.name, handle.in_ring.capacity,
+                handle.out_ring.shm.name, handle.out_ring.capacity,
+                *handle.open_args, handle.write_pos, handle.out_end)
+
+    def start(self):
+        self._results = self._ctx.Queue()
+        for _ in range(self.workers):
+            tasks, p = self._spawn()
+            self._tasks.append(tasks)
+            self._procs.append(p)
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def open_call(self, on_utterance: Callable[[bytes], None], samplerate=16000,
+                  frame_duration=30, aggressiveness=2, loop=None) -> CallHandle:
+        if loop is not None:
+            callback = on_utterance
+            on_utterance = lambda wav: loop.call_soon_threadsafe(callback, wav)
+        in_cap  = int(self.in_seconds  * samplerate) * 2
+        out_cap = int(self.out_seconds * samplerate) * 2
+        in_shm  = shared_memory.SharedMemory(create=True, size=in_cap)
+        out_shm = shared_memory.SharedMemory(create=True, size=out_cap)
+        with self._lock:
+            call_id = next(self._ids)
+            worker  = min(range(self.workers), key=self._load.__getitem__)
+            self._load[worker] += 1
+            notify_bytes = int(samplerate * self.notify_ms / 1000) * 2
+            handle = CallHandle(
+                self, call_id, worker, ShmRing(in_shm, in_cap), ShmRing(out_shm, out_cap),
+                on_utterance, notify_bytes
+            )
+            handle.open_args = (samplerate, frame_duration, aggressiveness)
+            self._calls[call_id] = handle
+            # under the lock, so a respawn can't slip in between
+            self._tasks[worker].put(self._open_msg(handle))
+        return handle
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers":    self.workers,
+                "calls":      len(self._calls),
+                "utterances": self.utterances,
+                "overruns":   self.overruns,
+                "restarts":   self.restarts,
+            }
+
+    def _check_workers(self):
+        """
+        Respawn dead workers and reopen their calls on the replacement. Audio
+        the dead worker hadn't segmented yet is skipped.
+        """
+        for i, p in enumerate(self._procs):
+            if p.is_alive() or self._closing:
+                continue
+            print(f"⚠️ DSP worker {p.pid} exited ({p.exitcode}); restarting", file=sys.stderr)
+            tasks, proc = self._spawn()
+            with self._lock:
+                old = self._tasks[i]
+                self._tasks[i], self._procs[i] = tasks, proc
+                self.restarts += 1
+                for handle in self._calls.values():
+                    if handle.worker != i:
+                        continue
+                    # a call that was closing just needs its close to land again
+                    tasks.put(self._open_msg(handle))
+                    if handle.closed:
+                        tasks.put(("close", handle.call_id))
+            # nobody reads the old queue any more; don't block exit flushing it
+            old.cancel_join_thread()
+            old.close()
+
+    def _dispatch(self):
+        """
+        Result thread: turn descriptors back into WAV bytes for each call.
+        """
+        next_check = time.monotonic() + self.check_s
+        while True:
+            # on a timer, so a steady stream of results can't starve the check
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.check_s
+            try:
+                msg = self._results.get(timeout=self.check_s)
+            except queue.Empty:
+                continue
+            if msg is None:
+                return
+            kind, call_id = msg[0], msg[1]
+            with self._lock:
+                handle = self._calls.get(call_id)
+            if kind == "utterance" and handle and not handle.closed:
+                _, _, start, length = msg
+                wav = handle.out_ring.read(start, start + length)
+                handle.out_end = start + length
+                self.utterances += 1
+                try:
+                    handle.on_utterance(wav)
+                except Exception as e:
+                    print("⚠️ DSP callback error:", e, file=sys.stderr)
+            elif kind == "overrun":
+                self.overruns += 1
+                print(f"⚠️ DSP call {call_id} overrun: dropped {msg[2]} bytes", file=sys.stderr)
+            elif kind == "closed" and handle:
+                with self._lock:
+                    self._calls.pop(call_id, None)
+                    self._load[handle.worker] -= 1
+                handle._unlink()
+
+    def close(self):
+        self._closing = True
+        for handle in list(self._calls.values()):
+            handle.close()
+        for tasks in self._tasks:
+            tasks.put(("stop",))
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.kill()
+        if self._thread:
+            # closes arrive before the stop sentinel, so their shm is unlinked
+            self._results.put(None)
+            self._thread.join(timeout=5)
+        # calls whose worker died never got a "closed" reply; unlink them here
+        with self._lock:
+            leftover, self._calls = list(self._calls.values()), {}
+        for handle in leftover:
+            handle._unlink()
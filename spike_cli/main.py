@@ -3,18 +3,17 @@ import asyncio
 import argparse
 import sys
 from pathlib import Path
-import yaml
 from dotenv import load_dotenv
 
+from spike_cli.audio_engine       import DuplexAudioEngine
+from spike_cli.config             import load_config
 from spike_cli.recorder           import Recorder
+from spike_cli.scheduler          import configure as configure_limits
 from spike_cli.stt                import DeepgramSTT
 from spike_cli.tts                import ElevenLabsTTS
 from spike_cli.player             import Player
 from spike_cli.verification_agent import VerificationAgent
-
-def load_config():
-    cfg_path = Path(__file__).parent.parent / "config.yml"
-    return yaml.safe_load(cfg_path.read_text())
+from spike_cli.dialogue           import APOLOGY, is_farewell
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -33,28 +32,38 @@ async def main():
         config.setdefault("tts", {})["voice_name"] = args.voice_name
 
     # 2) Initialize components
-    rec_cfg  = config.get("recorder", {})
+    configure_limits(config)
+    rec_cfg   = config.get("recorder", {})
+    audio_cfg = config.get("audio", {})
+    # one full-duplex stream for capture and playback, open for the whole call
+    engine = DuplexAudioEngine(
+        samplerate=rec_cfg.get("samplerate", 16000),
+        channels=1,
+        blocksize=audio_cfg.get("blocksize", 480),
+        latency=audio_cfg.get("latency", "low"),
+        device=audio_cfg.get("device")
+    )
     recorder = Recorder(
         samplerate=rec_cfg.get("samplerate", 16000),
         frame_duration=rec_cfg.get("frame_duration", 30),
-        aggressiveness=rec_cfg.get("aggressiveness", 2)
+        aggressiveness=rec_cfg.get("aggressiveness", 2),
+        engine=engine
     )
     stt    = DeepgramSTT(sample_rate=rec_cfg.get("samplerate", 16000))
     tts    = ElevenLabsTTS(config)
-    player = Player(sample_rate=rec_cfg.get("samplerate", 16000), channels=1)
+    player = Player(sample_rate=rec_cfg.get("samplerate", 16000), channels=1, engine=engine)
     agent  = VerificationAgent(config)
 
-    state = agent.initial_state.copy()
-    print("📋 Starting with state:", state)
+    print("📋 Starting with state:", agent.state)
 
     # shared error handler
     def handle_fatal_error():
-        apology = (
-            "I’m sorry, it seems something went wrong on our side. "
-            "I will make sure to call you back as soon as we have everything fixed. Goodbye."
-        )
         recorder.pause()
-        player.play(tts.synthesize(apology))
+        try:
+            player.play(tts.synthesize(APOLOGY, cacheable=True))
+        except Exception as e:
+            # e.g. the audio device went away; nothing left to say it on
+            print("⚠️ Playback error:", e, file=sys.stderr)
         recorder.stop()
 
     # 3) Queues and callbacks
@@ -86,45 +95,14 @@ async def main():
         while True:
             rep = await transcript_q.get()
             print(f"🎙️ Rep: {rep}")
-            buffer = ""
-            seen_fence = False
-
             def nl_cb(token: str):
-                nonlocal buffer, seen_fence
-                buffer += token
                 print(token, end="", flush=True)
 
-                # once we hit the JSON fence, speak the natural language part
-                if not seen_fence and "```json" in buffer:
-                    seen_fence = True
-                    nl_text, _ = buffer.split("```json", 1)
-                    nl_text = nl_text.strip()
-                    recorder.pause()
-                    try:
-                        player.play(tts.synthesize(nl_text))
-                    except Exception as e:
-                        print("⚠️ TTS error:", e, file=sys.stderr)
-                        handle_fatal_error()
-                        return
-                    recorder.resume()
-
-                    low = nl_text.lower()
-                    if any(f in low for f in ["goodbye", "have a great day", "thank you for your time"]):
-                        recorder.stop()
-
-            def state_cb(new_state: dict):
-                state.update(new_state)
-                print("\n📋 Info:", state)
-
-            try:
-                await agent.stream(rep, nl_cb, state_cb)
-            except Exception as e:
-                print("⚠️ Agent error:", e, file=sys.stderr)
-                handle_fatal_error()
-                return
-
-            if not seen_fence and buffer.strip():
-                nl_text = buffer.strip()
+            # the agent hands over the spoken part as soon as the model moves
+            # on to its state update
+            def reply_cb(nl_text: str):
+                if not nl_text:
+                    return
                 recorder.pause()
                 try:
                     player.play(tts.synthesize(nl_text))
@@ -133,15 +111,26 @@ async def main():
                     handle_fatal_error()
                     return
                 recorder.resume()
-                if any(f in nl_text.lower() for f in ["goodbye", "have a great day", "thank you for your time"]):
+
+                if is_farewell(nl_text):
                     recorder.stop()
 
+            def state_cb(changed: dict):
+                print("\n📋 Info:", agent.state)
+
+            try:
+                await agent.stream(rep, nl_cb, state_cb, reply_cb)
+            except Exception as e:
+                print("⚠️ Agent error:", e, file=sys.stderr)
+                handle_fatal_error()
+                return
+
     # 6) Play initial opener
     opener, _ = agent.process("")
-    nl = opener.split("```json")[0].strip()
+    nl = opener.strip()
     print(f"🤖 Spike Clinical: {nl}")
     recorder.pause()
-    player.play(tts.synthesize(nl))
+    player.play(tts.synthesize(nl, cacheable=True))
     recorder.resume()
 
     # 7) Run workers
@@ -155,6 +144,11 @@ async def main():
         pass
     finally:
         recorder.stop()
+        engine.close()
+        for tier, m in agent.router.metrics().items():
+            print(f"📈 {tier} ({m['model']}): {m['turns']} turns, "
+                  f"mean {m['mean_s']}s, p95 {m['p95_s']}s, "
+                  f"escalation rate {m['escalation_rate']:.0%}")
 
 if __name__ == "__main__":
     try:
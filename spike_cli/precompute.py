@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Render call openers ahead of time.
+
+The opener depends only on the model, the prompt template and the patient
+fields, so its text and audio can be produced before the line connects and
+served from the response caches when the call starts.
+
+    python -m spike_cli.precompute patients.yml
+
+patients.yml is a list of patient blocks (member_id, patient_name,
+date_of_birth). Results land in cache.dir, where the CLI and the media
+server pick them up.
+"""
+import argparse
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+import yaml
+from dotenv import load_dotenv
+
+from spike_cli.cache              import ResponseCache
+from spike_cli.config             import load_config, with_patient
+from spike_cli.router             import ModelRouter
+from spike_cli.scheduler          import batch_priority, configure as configure_limits
+from spike_cli.tts                import ElevenLabsTTS
+from spike_cli.verification_agent import VerificationAgent
+
+def render_opener(
+    config: dict,
+    tts: ElevenLabsTTS,
+    llm_cache: ResponseCache,
+    router: Optional[ModelRouter] = None,
+    agent_factory=VerificationAgent
+) -> Tuple[str, bytes]:
+    """
+    Produce (opener text, opener PCM) for config's patient, filling both caches.
+    Provider requests queue behind live call turns.
+    """
+    with batch_priority():
+        agent = agent_factory(config, router=router, cache=llm_cache)
+        reply, _ = agent.process("")
+        nl = reply.strip()
+        return nl, tts.synthesize(nl, cacheable=True)
+
+class OpenerPrefetcher:
+    """
+    Renders openers for upcoming calls on a small background pool, e.g. the
+    next patient in a campaign while the current call is still running.
+    """
+    def __init__(self, config: dict, tts: ElevenLabsTTS, llm_cache: ResponseCache,
+                 router: Optional[ModelRouter] = None, max_workers: int = 2,
+                 agent_factory=VerificationAgent):
+        self.config    = config
+        self.tts       = tts
+        self.llm_cache = llm_cache
+        self.router    = router
+        self.agent_factory = agent_factory
+        self._pool     = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def prefetch(self, patient: dict) -> Future:
+        cfg = with_patient(self.config, patient)
+        return self._pool.submit(
+            render_opener, cfg, self.tts, self.llm_cache, self.router, self.agent_factory
+        )
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+def main():
+    p = argparse.ArgumentParser(description="Pre-render call openers into the cache")
+    p.add_argument("patients", type=Path, help="YAML list of patient blocks")
+    p.add_argument("--workers", type=int, default=4)
+    args = p.parse_args()
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    config = load_config()
+    if not (config.get("cache") or {}).get("dir"):
+        sys.exit("Set cache.dir in config.yml so pre-rendered openers outlive this process")
+    configure_limits(config)
+
+    tts = ElevenLabsTTS(config)
+    prefetcher = OpenerPrefetcher(
+        config, tts, ResponseCache.from_config(config, "llm"), max_workers=args.workers
+    )
+    patients = yaml.safe_load(args.patients.read_text()) or []
+    futures = [(pt, prefetcher.prefetch(pt)) for pt in patients]
+    failed = 0
+    for pt, fut in futures:
+        try:
+            text, audio = fut.result()
+            print(f"✅ {pt.get('member_id')}: {len(audio)} bytes — {text[:60]}")
+        except Exception as e:
+            failed += 1
+            print(f"⚠️ {pt.get('member_id')}: {e}", file=sys.stderr)
+    prefetcher.shutdown()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,34 @@
 import queue
 import threading
 import webrtcvad
-import sounddevice as sd
+
+from spike_cli.audio_engine import DuplexAudioEngine
+from spike_cli.vad import UtteranceSegmenter
 
 class Recorder:
     """
     Recorder with VAD-based utterance segmentation and pause/resume support.
     Records short frames, detects speech start/end, and emits complete utterances.
+    Capture comes from a DuplexAudioEngine, normally shared with the Player.
     """
-    def __init__(self, samplerate=16000, frame_duration=30, aggressiveness=2):
+    def __init__(self, samplerate=16000, frame_duration=30, aggressiveness=2, engine=None):
         """
         samplerate: samples per second
         frame_duration: duration of each frame in ms (10, 20, or 30)
         aggressiveness: VAD sensitivity 0-3 (higher more aggressive)
+        engine: shared DuplexAudioEngine; if omitted the Recorder opens its own
         """
         self.samplerate = samplerate
         self.frame_duration = frame_duration
         self.frame_size = int(samplerate * frame_duration / 1000)
+        self.frame_bytes = self.frame_size * 2
         self.vad = webrtcvad.Vad(aggressiveness)
         self._audio_queue = queue.Queue()
+        self._pending = bytearray()
         self._thread = None
         self._running = False
-        self._stream = None
+        self._owns_engine = engine is None
+        self.engine = engine or DuplexAudioEngine(samplerate=samplerate, blocksize=self.frame_size)
 
     def start(self, callback):
         """
@@ -36,32 +43,30 @@ class Recorder:
         self._thread.daemon = True
         self._thread.start()
 
-        # Start non-blocking audio stream
-        self._stream = sd.InputStream(
-            samplerate=self.samplerate,
-            blocksize=self.frame_size,
-            channels=1,
-            dtype='int16',
-            callback=self._enqueue
-        )
-        self._stream.start()
+        self.engine.set_input_handler(self._enqueue)
+        self.engine.capturing = True
+        self.engine.start()
 
-    def _enqueue(self, indata, frames, time, status):
+    def _enqueue(self, data: bytes):
         """
-        Sounddevice callback: push raw bytes of each frame to queue.
+        Engine input handler (audio thread): push VAD-sized frames to the queue,
+        re-framing when the engine block size differs from the VAD frame.
         """
-        if status:
-            print(f"⚠️ Recorder status: {status}")
-        self._audio_queue.put(indata.tobytes())
+        if len(data) == self.frame_bytes and not self._pending:
+            self._audio_queue.put(data)
+            return
+        self._pending.extend(data)
+        while len(self._pending) >= self.frame_bytes:
+            self._audio_queue.put(bytes(self._pending[:self.frame_bytes]))
+            del self._pending[:self.frame_bytes]
 
     def _process_audio(self, callback):
         """
         Consume frames, apply VAD, accumulate into utterances.
         """
-        triggered = False
-        silent_frames = 0
-        utterance = bytearray()
-        threshold_silent = int(600 / self.frame_duration)  # ms of silence to end
+        segmenter = UtteranceSegmenter(
+            self.vad, samplerate=self.samplerate, frame_duration=self.frame_duration
+        )
 
         while self._running:
             try:
@@ -69,57 +74,35 @@ class Recorder:
             except queue.Empty:
                 continue
 
-            is_speech = self.vad.is_speech(frame, sample_rate=self.samplerate)
-
-            if not triggered:
-                if is_speech:
-                    triggered = True
-                    utterance.extend(frame)
-            else:
-                utterance.extend(frame)
-                if not is_speech:
-                    silent_frames += 1
-                    if silent_frames > threshold_silent:
-                        callback(bytes(utterance))
-                        triggered = False
-                        silent_frames = 0
-                        utterance = bytearray()
-                else:
-                    silent_frames = 0
+            utterance = segmenter.push(frame)
+            if utterance:
+                callback(utterance)
 
         # Emit any final utterance
+        utterance = segmenter.flush()
         if utterance:
-            callback(bytes(utterance))
+            callback(utterance)
 
     def pause(self):
         """
         Pause audio input to avoid feedback during playback.
+        The stream keeps running; captured blocks are simply dropped.
         """
-        if self._stream and self._running:
-            try:
-                self._stream.stop()
-            except Exception:
-                pass
+        self.engine.capturing = False
+        self._pending.clear()
 
     def resume(self):
         """
         Resume audio input after playback.
         """
-        if self._stream and self._running:
-            try:
-                self._stream.start()
-            except Exception:
-                pass
+        if self._running:
+            self.engine.capturing = True
 
     def stop(self):
         """
         Stop recording and terminate background thread.
         """
         self._running = False
-        # Stop and close the stream if active
-        if self._stream:
-            try:
-                self._stream.stop()
-                self._stream.close()
-            except Exception:
-                pass
\ No newline at end of file
+        self.engine.set_input_handler(None)
+        if self._owns_engine:
+            self.engine.close()
@@ -0,0 +1,93 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+FAST  = "fast"
+LARGE = "large"
+
+DEFAULT_HEDGES = (
+    "not sure", "i think", "maybe", "depends", "let me check",
+    "actually", "sorry", "repeat", "which one", "what do you mean",
+)
+
+class TierStats:
+    """Latency samples and escalation count for one tier."""
+    def __init__(self, window: int = 500):
+        self.turns       = 0
+        self.escalations = 0
+        self.seconds_total = 0.0
+        self.output_tokens_total = 0
+        self._recent = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, float]:
+        recent = sorted(self._recent)
+        p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        return {
+            "turns":           self.turns,
+            "mean_s":          round(self.seconds_total / self.turns, 4) if self.turns else 0.0,
+            "p95_s":           round(p95, 4),
+            "mean_output_tokens": round(self.output_tokens_total / self.turns, 1) if self.turns else 0.0,
+            "escalations":     self.escalations,
+            "escalation_rate": round(self.escalations / self.turns, 4) if self.turns else 0.0,
+        }
+
+class ModelRouter:
+    """
+    Picks the model tier for each turn. Routine slot-filling answers go to the
+    fast model; the opener, the recap (few fields left) and ambiguous answers
+    go to the large model. VerificationAgent escalates a fast turn to the large
+    model when its state update fails schema validation and reports it via record().
+
+    One router can be shared by every call in a process; metrics() aggregates them.
+    """
+    def __init__(self, config: dict):
+        agent_cfg = config["agent"]
+        routing   = agent_cfg.get("routing") or {}
+        large = routing.get("large_model") or agent_cfg["model"]
+        fast  = routing.get("fast_model") or large
+        self.models = {FAST: fast, LARGE: large}
+        self.recap_when_missing  = routing.get("recap_when_missing", 1)
+        self.ambiguous_min_words = routing.get("ambiguous_min_words", 30)
+        self.hedges = tuple(h.lower() for h in routing.get("hedges", DEFAULT_HEDGES))
+        self._stats = {FAST: TierStats(), LARGE: TierStats()}
+        self._lock  = threading.Lock()
+
+    def route(self, utterance: str, state: Optional[dict] = None) -> str:
+        """
+        Return FAST or LARGE for a rep utterance given the current state.
+        """
+        if self.models[FAST] == self.models[LARGE]:
+            return LARGE
+        # the opener sets the tone for the whole call
+        if not utterance.strip():
+            return LARGE
+        # recap: (almost) everything collected
+        if state and sum(v is None for v in state.values()) <= self.recap_when_missing:
+            return LARGE
+        low = utterance.lower()
+        if "?" in low or len(low.split()) >= self.ambiguous_min_words:
+            return LARGE
+        if any(h in low for h in self.hedges):
+            return LARGE
+        return FAST
+
+    def record(self, tier: str, seconds: float, escalated: bool = False, output_tokens: int = 0):
+        """
+        Record one completed request. For an escalated turn, record the failed
+        fast attempt with escalated=True and then the large retry as usual.
+        """
+        with self._lock:
+            stats = self._stats[tier]
+            stats.turns += 1
+            stats.seconds_total += seconds
+            stats.output_tokens_total += output_tokens
+            stats._recent.append(seconds)
+            if escalated:
+                stats.escalations += 1
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                tier: {"model": self.models[tier], **stats.snapshot()}
+                for tier, stats in self._stats.items()
+            }
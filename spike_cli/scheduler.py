@@ -0,0 +1,386 @@
+"""
+Process-wide request scheduling for the speech and LLM providers.
+
+Every DeepgramSTT, ElevenLabsTTS and VerificationAgent in a process goes
+through one ProviderScheduler per provider, so concurrent calls share a
+single view of the quota instead of bursting into 429s:
+
+  - token buckets for requests/sec and tokens/min (the provider's billing
+    unit: LLM tokens for OpenAI, characters for ElevenLabs)
+  - a cap on requests in flight (e.g. concurrent TTS streams)
+  - a priority queue: LIVE turns go before BATCH work (opener pre-rendering)
+  - 429s pause the whole provider and retry with backoff
+
+Limits come from the `limits:` section of config.yml via configure().
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+LIVE  = 0
+BATCH = 1
+PRIORITY_NAMES = {LIVE: "live", BATCH: "batch"}
+
+_priority = contextvars.ContextVar("provider_priority", default=LIVE)
+
+@contextmanager
+def batch_priority():
+    """
+    Requests made inside this block (same thread or task) queue as BATCH.
+    """
+    token = _priority.set(BATCH)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class RateLimited(Exception):
+    """A provider kept answering 429 after all retries."""
+
+def is_rate_limited(exc: BaseException) -> bool:
+    # openai / elevenlabs: status_code; deepgram: http_error_status
+    for attr in ("status_code", "http_error_status", "status"):
+        if getattr(exc, attr, None) == 429:
+            return True
+    return False
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the error, if there is one."""
+    for source in (getattr(exc, "response", None), getattr(exc, "http_library_error", None), exc):
+        headers = getattr(source, "headers", None)
+        if headers:
+            try:
+                return float(headers.get("retry-after") or headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+    return None
+
+class TokenBucket:
+    """
+    Refills `rate` units per second up to `capacity`. The level may go
+    negative when a request turns out to cost more than estimated.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate     = rate
+        self.capacity = capacity
+        self.level    = capacity
+        self._stamp   = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level  = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` is available (0 = now). Requests larger than
+        the bucket only wait for a full bucket.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "queued_at")
+    def __init__(self, priority, seq, tokens):
+        self.priority  = priority
+        self.seq       = seq
+        self.tokens    = tokens
+        self.queued_at = time.monotonic()
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class PriorityStats:
+    """Queue-wait samples for one priority."""
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.wait_seconds_total = 0.0
+        self._recent = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, float]:
+        recent = sorted(self._recent)
+        p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        return {
+            "requests":           self.requests,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_p95_s":         round(p95, 4),
+        }
+
+class ProviderScheduler:
+    """
+    Admits requests to one provider in priority order within its limits.
+
+        with scheduler.slot(tokens=estimate):
+            resp = client.call(...)
+        scheduler.charge(actual - estimate)
+
+    or, with 429 retries: scheduler.call(fn, *args, tokens=estimate), or
+    `with scheduler.streaming(fn, ...) as stream:` to hold the slot while
+    a streamed response is read.
+    Only the head of the queue may start, so a BATCH request never
+    overtakes a waiting LIVE one. None for a limit means unlimited.
+    """
+    def __init__(self, name: str, requests_per_second: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_concurrent: Optional[int] = None,
+                 max_retries: int = 4, backoff_s: float = 0.5):
+        self.name = name
+        self._cond    = threading.Condition()
+        self._waiting = []
+        self._seq     = itertools.count()
+        self._in_flight    = 0
+        self._paused_until = 0.0
+        self.throttled = 0
+        self.failed    = 0
+        self._stats = {p: PriorityStats() for p in PRIORITY_NAMES}
+        self.set_limits(requests_per_second, tokens_per_minute, max_concurrent, max_retries, backoff_s)
+
+    def set_limits(self, requests_per_second=None, tokens_per_minute=None, max_concurrent=None,
+                   max_retries: int = 4, backoff_s: float = 0.5):
+        with self._cond:
+            self.requests_per_second = requests_per_second
+            self.tokens_per_minute   = tokens_per_minute
+            self.max_concurrent      = max_concurrent
+            self.max_retries = max_retries
+            self.backoff_s   = backoff_s
+            self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+            self._tokens   = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+            self._cond.notify_all()
+
+    def _admit(self, waiter: _Waiter) -> float:
+        """
+        Start `waiter` if it may go now and return 0; otherwise return the
+        seconds to wait (inf = until another request finishes). Holds _cond.
+        """
+        if self._waiting[0] is not waiter:
+            return math.inf
+        if self.max_concurrent and self._in_flight >= self.max_concurrent:
+            return math.inf
+        now = time.monotonic()
+        wait = self._paused_until - now
+        if self._requests:
+            wait = max(wait, self._requests.delay(1, now))
+        if self._tokens and waiter.tokens:
+            wait = max(wait, self._tokens.delay(waiter.tokens, now))
+        if wait > 0:
+            return wait
+        if self._requests:
+            self._requests.take(1, now)
+        if self._tokens and waiter.tokens:
+            self._tokens.take(waiter.tokens, now)
+        heapq.heappop(self._waiting)
+        self._in_flight += 1
+        stats = self._stats[waiter.priority]
+        stats.requests += 1
+        stats.wait_seconds_total += now - waiter.queued_at
+        stats._recent.append(now - waiter.queued_at)
+        # the next in line may be able to go too
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, tokens: float, priority: Optional[int]) -> _Waiter:
+        waiter = _Waiter(_priority.get() if priority is None else priority, next(self._seq), tokens)
+        heapq.heappush(self._waiting, waiter)
+        return waiter
+
+    def _abandon(self, waiter: _Waiter):
+        if waiter in self._waiting:
+            self._waiting.remove(waiter)
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def acquire(self, tokens: float = 0, priority: Optional[int] = None):
+        """
+        Block until the request may start. Pair with release().
+        """
+        with self._cond:
+            waiter = self._enqueue(tokens, priority)
+            try:
+                while (wait := self._admit(waiter)) > 0:
+                    self._cond.wait(None if wait == math.inf else wait)
+            except BaseException:
+                self._abandon(waiter)
+                raise
+
+    async def acquire_async(self, tokens: float = 0, priority: Optional[int] = None):
+        """
+        Like acquire() without blocking the event loop. The queue is shared
+        with threaded callers, so a blocked head is polled rather than notified.
+        """
+        with self._cond:
+            waiter = self._enqueue(tokens, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(waiter)
+                if not wait:
+                    return
+                await asyncio.sleep(min(wait, 0.02))
+        except BaseException:
+            with self._cond:
+                self._abandon(waiter)
+            raise
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: float = 0, priority: Optional[int] = None):
+        self.acquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, tokens: float = 0, priority: Optional[int] = None):
+        await self.acquire_async(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def charge(self, tokens: float):
+        """
+        Correct the token bucket once a request's real cost is known
+        (positive: it cost more than estimated, negative: less).
+        """
+        if self._tokens and tokens:
+            with self._cond:
+                now = time.monotonic()
+                self._tokens.take(tokens, now)
+                self._tokens.level = min(self._tokens.level, self._tokens.capacity)
+                self._cond.notify_all()
+
+    def _throttled(self, exc: BaseException, attempt: int) -> float:
+        """
+        Record a 429 and pause the provider; returns the backoff in seconds.
+        """
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = self.backoff_s * 2 ** attempt * (1 + random.random() / 2)
+        with self._cond:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        print(f"⏳ {self.name} rate limited; retrying in {delay:.1f}s")
+        return delay
+
+    def _give_up(self, exc: BaseException):
+        with self._cond:
+            self.failed += 1
+        raise RateLimited(f"{self.name}: still rate limited after {self.max_retries} retries") from exc
+
+    def call(self, fn, *args, tokens: float = 0, priority: Optional[int] = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) in a slot, retrying 429s with backoff.
+        """
+        with self.streaming(fn, *args, tokens=tokens, priority=priority, **kwargs) as result:
+            return result
+
+    @contextmanager
+    def streaming(self, fn, *args, tokens: float = 0, priority: Optional[int] = None, **kwargs):
+        """
+        Like call(), but the slot stays held until the with block ends, so a
+        streamed response counts as in flight while it is read.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens, priority)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release()
+                if not is_rate_limited(e):
+                    raise
+                if attempt == self.max_retries:
+                    self._give_up(e)
+                time.sleep(self._throttled(e, attempt))
+                continue
+            try:
+                yield result
+            finally:
+                self.release()
+            return
+
+    async def call_async(self, fn, *args, tokens: float = 0, priority: Optional[int] = None, **kwargs):
+        """
+        Await fn(*args, **kwargs) in a slot, retrying 429s with backoff.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot_async(tokens, priority):
+                    return await fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                if attempt == self.max_retries:
+                    self._give_up(e)
+                await asyncio.sleep(self._throttled(e, attempt))
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "queued":     len(self._waiting),
+                "in_flight":  self._in_flight,
+                "throttled":  self.throttled,
+                "failed":     self.failed,
+                "priorities": {PRIORITY_NAMES[p]: s.snapshot() for p, s in self._stats.items()},
+            }
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_registry_lock = threading.Lock()
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    """
+    The process-wide scheduler for a provider (unlimited until configured).
+    """
+    with _registry_lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = ProviderScheduler(provider)
+        return _schedulers[provider]
+
+def configure(config: dict, share: int = 1, index: int = 0):
+    """
+    Apply config.yml `limits:` to the process-wide schedulers. `share` splits
+    each quota across processes on one API key (e.g. server workers); this
+    process is number `index` of them. Rates are split evenly; concurrency
+    slots are whole, so the remainder goes to the first workers and the total
+    never exceeds the quota. Raises ValueError if there are fewer slots than
+    processes. Schedulers already handed out keep their identity and pick up
+    the limits.
+    """
+    def part(value):
+        return value / share if value else None
+
+    for provider, cfg in (config.get("limits") or {}).items():
+        cfg = cfg or {}
+        max_concurrent = cfg.get("max_concurrent")
+        if max_concurrent:
+            if max_concurrent < share:
+                raise ValueError(
+                    f"limits.{provider}.max_concurrent ({max_concurrent}) is lower than the "
+                    f"number of server workers ({share}); lower server.workers or raise the limit"
+                )
+            max_concurrent = max_concurrent // share + (index < max_concurrent % share)
+        get_scheduler(provider).set_limits(
+            requests_per_second=part(cfg.get("requests_per_second")),
+            tokens_per_minute=part(cfg.get("tokens_per_minute")),
+            max_concurrent=max_concurrent or None,
+            max_retries=cfg.get("max_retries", 4),
+            backoff_s=cfg.get("backoff_s", 0.5),
+        )
+
+def all_schedulers() -> Dict[str, ProviderScheduler]:
+    with _registry_lock:
+        return dict(_schedulers)
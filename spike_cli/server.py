@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+WebSocket media server: drives verification calls from a telephony gateway
+instead of the local microphone/speaker.
+
+Protocol on GET /ws (one call per connection):
+  - client → server: binary messages of raw 16-bit mono PCM at recorder.samplerate,
+    optional text message {"type": "hangup"}
+  - server → client: binary messages of TTS PCM (tts.output_format), and JSON text
+    events: start, transcript, reply, state (changed fields only), hangup
+
+Patient fields can be passed as query params (?member_id=...&patient_name=...
+&date_of_birth=...), overriding the patient block in config.yml.
+POST /prefetch with the same fields as a JSON body renders that patient's
+opener (text and audio) into the caches before the line connects.
+Echo cancellation is left to the gateway.
+
+With server.dsp_workers > 0, VAD segmentation and WAV encoding move off the
+event loop into a shared-memory DSPPool; the loop only sees utterance WAVs.
+
+Workers are separate processes that each bind the same port with SO_REUSEPORT,
+so the kernel spreads connections across cores. /healthz and /metrics report
+on the worker that answers. SIGTERM drains: health turns 503, new calls are
+refused, live calls get up to server.drain_timeout seconds to finish.
+
+Provider requests from all calls on a worker share the process-wide
+schedulers in spike_cli.scheduler; the `limits:` quotas are split evenly
+across workers, and /metrics reports their queue waits.
+"""
+import asyncio
+import argparse
+import json
+import multiprocessing as mp
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import webrtcvad
+from aiohttp import web, WSCloseCode, WSMsgType
+from dotenv import load_dotenv
+
+from spike_cli.cache              import ResponseCache
+from spike_cli.config             import PATIENT_FIELDS, load_config, with_patient
+from spike_cli.dialogue           import APOLOGY, is_farewell
+from spike_cli.dsp_pool           import DSPPool
+from spike_cli.precompute         import OpenerPrefetcher
+from spike_cli.router             import ModelRouter
+from spike_cli.scheduler          import all_schedulers, configure as configure_limits
+from spike_cli.stt                import DeepgramSTT
+from spike_cli.tts                import ElevenLabsTTS
+from spike_cli.vad                import UtteranceSegmenter
+from spike_cli.verification_agent import VerificationAgent
+
+CHUNK_BYTES = 3200  # 100 ms of 16 kHz mono PCM per outbound message
+
+class Metrics:
+    """Per-worker counters, rendered in Prometheus text format."""
+    def __init__(self, router: ModelRouter, dsp_pool: DSPPool = None):
+        self.router             = router
+        self.dsp_pool           = dsp_pool
+        self.active_sessions    = 0
+        self.sessions_total     = 0
+        self.rejected_total     = 0
+        self.turns_total        = 0
+        self.errors_total       = 0
+        self.turn_seconds_total = 0.0
+
+    def render(self) -> str:
+        pid = os.getpid()
+        lines = []
+        for name, kind, value in (
+            ("spike_active_sessions",    "gauge",   self.active_sessions),
+            ("spike_sessions_total",     "counter", self.sessions_total),
+            ("spike_rejected_total",     "counter", self.rejected_total),
+            ("spike_turns_total",        "counter", self.turns_total),
+            ("spike_errors_total",       "counter", self.errors_total),
+            ("spike_turn_seconds_total", "counter", round(self.turn_seconds_total, 6)),
+        ):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f'{name}{{pid="{pid}"}} {value}')
+        if self.dsp_pool:
+            for key, value in self.dsp_pool.stats().items():
+                name = f"spike_dsp_{key}"
+                lines.append(f"# TYPE {name} {'gauge' if key in ('workers', 'calls') else 'counter'}")
+                lines.append(f'{name}{{pid="{pid}"}} {value}')
+        tiers = self.router.metrics()
+        for key, kind in (("turns", "counter"), ("escalations", "counter"),
+                          ("mean_s", "gauge"), ("p95_s", "gauge"),
+                          ("mean_output_tokens", "gauge")):
+            name = f"spike_llm_tier_{key}"
+            lines.append(f"# TYPE {name} {kind}")
+            for tier, m in tiers.items():
+                lines.append(f'{name}{{pid="{pid}",tier="{tier}",model="{m["model"]}"}} {m[key]}')
+        providers = {name: s.stats() for name, s in sorted(all_schedulers().items())}
+        for key, kind in (("queued", "gauge"), ("in_flight", "gauge"),
+                          ("throttled", "counter"), ("failed", "counter")):
+            name = f"spike_provider_{key}"
+            lines.append(f"# TYPE {name} {kind}")
+            for provider, s in providers.items():
+                lines.append(f'{name}{{pid="{pid}",provider="{provider}"}} {s[key]}')
+        for key, kind in (("requests", "counter"), ("wait_seconds_total", "counter"),
+                          ("wait_p95_s", "gauge")):
+            name = f"spike_provider_{key}"
+            lines.append(f"# TYPE {name} {kind}")
+            for provider, s in providers.items():
+                for priority, p in s["priorities"].items():
+                    lines.append(f'{name}{{pid="{pid}",provider="{provider}",priority="{priority}"}} {p[key]}')
+        return "\n".join(lines) + "\n"
+
+def _control_type(data: str):
+    """
+    The "type" of a client control message, or None for anything malformed;
+    bad client input shouldn't end the call.
+    """
+    try:
+        msg = json.loads(data)
+    except ValueError:
+        return None
+    return msg.get("type") if isinstance(msg, dict) else None
+
+class CallSession:
+    """
+    One verification call over a websocket, reusing the worker's STT/TTS
+    clients and a fresh VerificationAgent. Blocking SDK calls run in the
+    worker's thread pool so other calls on the same loop keep flowing.
+    """
+    def __init__(self, ws: web.WebSocketResponse, config: dict, stt, tts, agent_factory,
+                 metrics: Metrics, llm_cache: ResponseCache, dsp_pool: DSPPool = None):
+        self.ws      = ws
+        self.config  = config
+        self.stt     = stt
+        self.tts     = tts
+        self.metrics = metrics
+        self.agent   = agent_factory(config, router=metrics.router, cache=llm_cache)
+        self.dsp_pool = dsp_pool
+        rec_cfg = config.get("recorder", {})
+        self.sample_rate    = rec_cfg.get("samplerate", 16000)
+        self.frame_duration = rec_cfg.get("frame_duration", 30)
+        self.aggressiveness = rec_cfg.get("aggressiveness", 2)
+        self._utterances = asyncio.Queue()
+
+    def _audio_sink(self):
+        """
+        Where inbound PCM goes: a DSP pool call (utterances come back as WAV)
+        or an in-process segmenter (utterances are raw PCM).
+        """
+        if self.dsp_pool:
+            call = self.dsp_pool.open_call(
+                self._utterances.put_nowait, samplerate=self.sample_rate,
+                frame_duration=self.frame_duration, aggressiveness=self.aggressiveness,
+                loop=asyncio.get_running_loop()
+            )
+            return call.write, call.close
+        segmenter = UtteranceSegmenter(
+            webrtcvad.Vad(self.aggressiveness),
+            samplerate=self.sample_rate, frame_duration=self.frame_duration
+        )
+        def write(pcm: bytes):
+            for utt in segmenter.feed(pcm):
+                self._utterances.put_nowait(utt)
+        return write, lambda: None
+
+    async def _transcribe(self, utterance: bytes) -> str:
+        if self.dsp_pool:
+            return await self.stt.transcribe_wav(utterance)
+        return await self.stt.transcribe(utterance)
+
+    async def run(self):
+        await self.ws.send_json({
+            "type": "start",
+            "sample_rate": self.sample_rate,
+            "state": self.agent.initial_state,
+        })
+        write, close_audio = self._audio_sink()
+        turns = asyncio.create_task(self._turn_worker())
+        try:
+            async for msg in self.ws:
+                if msg.type == WSMsgType.BINARY:
+                    write(msg.data)
+                elif msg.type == WSMsgType.TEXT:
+                    if _control_type(msg.data) == "hangup":
+                        break
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            close_audio()
+            turns.cancel()
+            try:
+                await turns
+            except asyncio.CancelledError:
+                pass
+
+    async def _turn_worker(self):
+        loop = asyncio.get_running_loop()
+        # opener first, then one turn per rep utterance
+        rep = ""
+        while True:
+            started = time.perf_counter()
+            try:
+                reply, new_state = await loop.run_in_executor(None, self.agent.process, rep)
+                nl = reply.strip()
+                await self.ws.send_json({"type": "reply", "text": nl})
+                if new_state:
+                    await self.ws.send_json({"type": "state", "state": new_state})
+                if nl:
+                    await self._speak(nl, cacheable=not rep)
+            except Exception as e:
+                print("⚠️ Session error:", e, file=sys.stderr)
+                self.metrics.errors_total += 1
+                await self._hangup(APOLOGY)
+                return
+            self.metrics.turns_total += 1
+            self.metrics.turn_seconds_total += time.perf_counter() - started
+
+            if is_farewell(nl):
+                await self._hangup()
+                return
+
+            rep = ""
+            while not rep:
+                rep = await self._transcribe(await self._utterances.get())
+            await self.ws.send_json({"type": "transcript", "text": rep})
+
+    async def _speak(self, text: str, cacheable: bool = False):
+        pcm = await asyncio.get_running_loop().run_in_executor(
+            None, self.tts.synthesize, text, cacheable
+        )
+        for off in range(0, len(pcm), CHUNK_BYTES):
+            await self.ws.send_bytes(pcm[off:off + CHUNK_BYTES])
+
+    async def _hangup(self, text: str = ""):
+        try:
+            if text:
+                await self._speak(text, cacheable=True)
+            await self.ws.send_json({"type": "hangup"})
+            await self.ws.close()
+        except Exception:
+            pass
+
+CONFIG_KEY   = web.AppKey("config", dict)
+STT_KEY      = web.AppKey("stt", object)
+TTS_KEY      = web.AppKey("tts", object)
+AGENT_KEY    = web.AppKey("agent_factory", object)
+METRICS_KEY  = web.AppKey("metrics", Metrics)
+DRAINING_KEY = web.AppKey("draining", asyncio.Event)
+SOCKETS_KEY  = web.AppKey("sockets", set)
+CACHE_KEY    = web.AppKey("llm_cache", ResponseCache)
+PREFETCH_KEY = web.AppKey("prefetcher", OpenerPrefetcher)
+DSP_KEY      = web.AppKey("dsp_pool", object)
+
+def create_app(config: dict, stt=None, tts=None, agent_factory=VerificationAgent,
+               dsp_pool: DSPPool = None) -> web.Application:
+    """
+    Build the aiohttp app for one worker. STT/TTS clients, the model router and
+    the DSP pool (server.dsp_workers > 0) are shared by every call on the
+    worker; pass stubs in for testing.
+    """
+    rec_cfg = config.get("recorder", {})
+    dsp_workers = config.get("server", {}).get("dsp_workers", 0)
+    if dsp_pool is None and dsp_workers:
+        dsp_pool = DSPPool(workers=dsp_workers)
+        dsp_pool.start()
+
+    app = web.Application()
+    app[CONFIG_KEY]   = config
+    app[STT_KEY]      = stt or DeepgramSTT(sample_rate=rec_cfg.get("samplerate", 16000))
+    app[TTS_KEY]      = tts or ElevenLabsTTS(config)
+    app[AGENT_KEY]    = agent_factory
+    app[METRICS_KEY]  = Metrics(ModelRouter(config), dsp_pool)
+    app[DRAINING_KEY] = asyncio.Event()
+    app[SOCKETS_KEY]  = set()
+    app[CACHE_KEY]    = ResponseCache.from_config(config, "llm")
+    app[DSP_KEY]      = dsp_pool
+    app[PREFETCH_KEY] = OpenerPrefetcher(
+        config, app[TTS_KEY], app[CACHE_KEY], router=app[METRICS_KEY].router,
+        agent_factory=agent_factory
+    )
+
+    app.router.add_get("/healthz",   _healthz)
+    app.router.add_get("/metrics",   _metrics)
+    app.router.add_post("/prefetch", _prefetch)
+    app.router.add_get("/ws",        _media)
+    app.on_shutdown.append(_close_sockets)
+    app.on_cleanup.append(_stop_prefetcher)
+    if dsp_pool:
+        app.on_cleanup.append(_stop_dsp_pool)
+    return app
+
+async def _healthz(request: web.Request) -> web.Response:
+    app = request.app
+    status = 503 if app[DRAINING_KEY].is_set() else 200
+    return web.json_response({
+        "status":   "draining" if app[DRAINING_KEY].is_set() else "ok",
+        "pid":      os.getpid(),
+        "sessions": app[METRICS_KEY].active_sessions,
+    }, status=status)
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(text=request.app[METRICS_KEY].render(), content_type="text/plain")
+
+async def _prefetch(request: web.Request) -> web.Response:
+    try:
+        patient = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="expected a JSON object")
+    if not isinstance(patient, dict) or not any(patient.get(k) for k in PATIENT_FIELDS):
+        raise web.HTTPBadRequest(text=f"expected any of {', '.join(PATIENT_FIELDS)}")
+    fut = request.app[PREFETCH_KEY].prefetch(patient)
+    fut.add_done_callback(_log_prefetch_error)
+    return web.json_response({"status": "scheduled"}, status=202)
+
+def _log_prefetch_error(fut):
+    if fut.exception():
+        print("⚠️ Prefetch error:", fut.exception(), file=sys.stderr)
+
+async def _media(request: web.Request) -> web.StreamResponse:
+    app = request.app
+    metrics = app[METRICS_KEY]
+    if app[DRAINING_KEY].is_set():
+        metrics.rejected_total += 1
+        raise web.HTTPServiceUnavailable(text="draining")
+
+    config = with_patient(app[CONFIG_KEY], request.query)
+
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    app[SOCKETS_KEY].add(ws)
+    metrics.active_sessions += 1
+    metrics.sessions_total  += 1
+    try:
+        session = CallSession(
+            ws, config, app[STT_KEY], app[TTS_KEY], app[AGENT_KEY], metrics,
+            app[CACHE_KEY], app[DSP_KEY]
+        )
+        await session.run()
+    except Exception as e:
+        print("⚠️ Session error:", e, file=sys.stderr)
+        metrics.errors_total += 1
+    finally:
+        metrics.active_sessions -= 1
+        app[SOCKETS_KEY].discard(ws)
+        if not ws.closed:
+            await ws.close()
+    return ws
+
+async def _close_sockets(app: web.Application):
+    for ws in set(app[SOCKETS_KEY]):
+        await ws.close(code=WSCloseCode.GOING_AWAY, message=b"server shutdown")
+
+async def _stop_prefetcher(app: web.Application):
+    app[PREFETCH_KEY].shutdown()
+
+async def _stop_dsp_pool(app: web.Application):
+    app[DSP_KEY].close()
+
+async def drain(app: web.Application, timeout: float):
+    """
+    Stop taking new calls and wait (up to timeout seconds) for live ones to end.
+    """
+    app[DRAINING_KEY].set()
+    deadline = time.monotonic() + timeout
+    while app[METRICS_KEY].active_sessions and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+
+async def serve(config: dict, host: str, port: int, reuse_port: bool = False,
+                workers: int = 1, index: int = 0):
+    srv_cfg = config.get("server", {})
+    configure_limits(config, share=workers, index=index)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=srv_cfg.get("threads", 32)))
+
+    app = create_app(config)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port)
+    await site.start()
+    print(f"🟢 Worker {os.getpid()} serving on {host}:{port}")
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print(f"🟡 Worker {os.getpid()} draining...")
+    await drain(app, srv_cfg.get("drain_timeout", 30))
+    await runner.cleanup()
+
+def _run_worker(config: dict, host: str, port: int, workers: int, index: int):
+    asyncio.run(serve(config, host, port, reuse_port=True, workers=workers, index=index))
+
+def spawn_worker(target, *args) -> mp.Process:
+    """
+    Start a server worker process. Workers are not daemons, so they may start
+    children of their own (the DSP pool); main() terminates and joins them.
+    """
+    p = mp.get_context("spawn").Process(target=target, args=args)
+    p.start()
+    return p
+
+def parse_args(srv_cfg: dict):
+    p = argparse.ArgumentParser(description="Serve verification calls over websockets")
+    p.add_argument("--host", default=srv_cfg.get("host", "0.0.0.0"))
+    p.add_argument("--port", type=int, default=srv_cfg.get("port", 8080))
+    p.add_argument(
+        "--workers", type=int, default=srv_cfg.get("workers", 0),
+        help="worker processes (0 = one per CPU core)"
+    )
+    return p.parse_args()
+
+def main():
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    config = load_config()
+    args = parse_args(config.get("server", {}))
+    workers = args.workers or os.cpu_count() or 1
+    try:
+        # check the quota split before starting workers that would all fail on it
+        configure_limits(config, share=workers)
+    except ValueError as e:
+        sys.exit(f"⚠️ {e}")
+
+    if workers == 1:
+        asyncio.run(serve(config, args.host, args.port))
+        return
+
+    def start_worker(index: int):
+        return spawn_worker(_run_worker, config, args.host, args.port, workers, index)
+
+    procs = [start_worker(i) for i in range(workers)]
+    stopping = False
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for p in procs:
+            if p.is_alive():
+                p.terminate()  # SIGTERM -> worker drains
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT,  on_signal)
+
+    # respawn crashed workers until asked to stop
+    while not stopping:
+        time.sleep(0.5)
+        for i, p in enumerate(procs):
+            if not p.is_alive() and not stopping:
+                print(f"⚠️ Worker {p.pid} exited ({p.exitcode}); restarting", file=sys.stderr)
+                procs[i] = start_worker(i)
+
+    grace = config.get("server", {}).get("drain_timeout", 30) + 5
+    deadline = time.monotonic() + grace
+    for p in procs:
+        p.join(max(0.0, deadline - time.monotonic()))
+        if p.is_alive():
+            p.kill()
+    print("🛑 Server stopped.")
+
+if __name__ == "__main__":
+    main()
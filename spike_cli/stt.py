@@ -10,7 +10,9 @@ import os
 import io
 
 from deepgram import Deepgram
-import wave
+
+from spike_cli.scheduler import ProviderScheduler, get_scheduler
+from spike_cli.wav       import encode_wav
 
 class STT:
     """Base class for speech-to-text implementations."""
@@ -20,26 +22,37 @@ class STT:
 
 class DeepgramSTT(STT):
     """Deepgram STT supporting both prerecord and live streaming via WebSockets."""
-    def __init__(self, sample_rate: int = 16000):
+    def __init__(self, sample_rate: int = 16000, scheduler: ProviderScheduler = None):
         api_key = os.getenv("DEEPGRAM_API_KEY")
         if not api_key:
             raise ValueError("Missing DEEPGRAM_API_KEY in environment")
         self.dg_client = Deepgram(api_key)
         self.sample_rate = sample_rate
+        self.scheduler   = scheduler or get_scheduler("deepgram")
+
+    def _to_wav(self, audio_bytes: bytes) -> io.BytesIO:
+        """
+        Wrap raw 16-bit mono PCM in an in-memory WAV container.
+        """
+        return io.BytesIO(encode_wav(audio_bytes, self.sample_rate))
 
     async def transcribe(self, audio_bytes: bytes) -> str:
         # fallback prerecord method
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(self.sample_rate)
-            wf.writeframes(audio_bytes)
-        wav_buffer.seek(0)
-        try:
+        return await self.transcribe_wav(self._to_wav(audio_bytes))
+
+    async def transcribe_wav(self, wav) -> str:
+        """
+        Transcribe an already-encoded WAV (bytes or file-like), e.g. one
+        produced by the DSP worker pool.
+        """
+        wav_buffer = io.BytesIO(wav) if isinstance(wav, (bytes, bytearray)) else wav
+        async def request():
+            wav_buffer.seek(0)  # rewind for 429 retries
             source  = {'buffer': wav_buffer, 'mimetype': 'audio/wav'}
             opts = {'punctuate': True}
-            resp = await self.dg_client.transcription.prerecorded(source, opts)
+            return await self.dg_client.transcription.prerecorded(source, opts)
+        try:
+            resp = await self.scheduler.call_async(request)
         except Exception as e:
             print(f"⚠️ STT error: {e}")
             return ""
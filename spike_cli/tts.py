@@ -1,7 +1,11 @@
 import os
 import asyncio
+from typing import Optional
 from elevenlabs import ElevenLabs, VoiceSettings
 
+from spike_cli.cache     import ResponseCache, audio_key
+from spike_cli.scheduler import ProviderScheduler, get_scheduler
+
 class ElevenLabsTTS:
     """
     ElevenLabs TTS wrapper supporting both batch synthesize and async streaming.
@@ -30,7 +34,8 @@ class ElevenLabsTTS:
                 return v.voice_id
         raise KeyError(f"No ElevenLabs voice named {name!r}")
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, cache: Optional[ResponseCache] = None,
+                 scheduler: Optional[ProviderScheduler] = None):
         raw_key = os.getenv("ELEVENLABS_API_KEY", "").strip()
         if not raw_key:
             raise ValueError("Missing ELEVENLABS_API_KEY")
@@ -55,11 +60,33 @@ class ElevenLabsTTS:
             stability=cfg_tts.get("stability", 0.75),
             similarity_boost=cfg_tts.get("similarity_boost", 0.75)
         )
+        self.cache = cache or ResponseCache.from_config(config, "tts")
+        # ElevenLabs bills per character, so characters are the scheduler's tokens
+        self.scheduler = scheduler or get_scheduler("elevenlabs")
 
-    def synthesize(self, text: str) -> bytes:
+    def synthesize(self, text: str, cacheable: bool = False) -> bytes:
         """
         Synchronous batch synthesis: returns full PCM bytes.
+        cacheable: text is known ahead of time (opener, apology), so keep the
+        audio in the cache and serve repeats from there.
         """
+        if not cacheable:
+            return self._convert(text)
+        key = audio_key(
+            text, self.voice_id, self.model_id, self.output_format,
+            self.voice_settings.stability, self.voice_settings.similarity_boost
+        )
+        audio = self.cache.get(key)
+        if audio is None:
+            audio = self._convert(text)
+            self.cache.put(key, audio)
+        return audio
+
+    def _convert(self, text: str) -> bytes:
+        return self.scheduler.call(self._request, text, tokens=len(text))
+
+    def _request(self, text: str) -> bytes:
+        # consumed inside the scheduler slot, so a slot is one open TTS stream
         audio_chunks = self.client.text_to_speech.convert(
             text=text,
             voice_id=self.voice_id,
@@ -95,5 +122,6 @@ class ElevenLabsTTS:
                 # feed into Python queue via threadsafe
                 asyncio.run_coroutine_threadsafe(pcm_queue.put(chunk), loop)
 
-        # launch in executor
-        await loop.run_in_executor(None, _stream_to_queue)
+        # launch in a thread (keeping the caller's scheduler priority),
+        # holding a scheduler slot for the whole stream
+        await asyncio.to_thread(self.scheduler.call, _stream_to_queue, tokens=len(text))
@@ -0,0 +1,74 @@
+from typing import List, Optional
+
+class UtteranceSegmenter:
+    """
+    VAD state machine shared by the microphone Recorder and the media server.
+    Feed it fixed-size PCM frames; it returns a complete utterance once enough
+    trailing silence has been seen.
+    """
+    def __init__(self, vad, samplerate=16000, frame_duration=30, silence_ms=600):
+        """
+        vad: object with is_speech(frame, sample_rate), e.g. webrtcvad.Vad
+        frame_duration: duration of each frame in ms (10, 20, or 30)
+        silence_ms: ms of silence that ends an utterance
+        """
+        self.vad = vad
+        self.samplerate = samplerate
+        self.frame_bytes = int(samplerate * frame_duration / 1000) * 2
+        self.threshold_silent = int(silence_ms / frame_duration)
+        self._triggered = False
+        self._silent_frames = 0
+        self._utterance = bytearray()
+        self._pending = bytearray()
+
+    def push(self, frame: bytes) -> Optional[bytes]:
+        """
+        Process one frame. Returns the utterance bytes when one ends, else None.
+        """
+        is_speech = self.vad.is_speech(frame, sample_rate=self.samplerate)
+
+        if not self._triggered:
+            if is_speech:
+                self._triggered = True
+                self._utterance.extend(frame)
+            return None
+
+        self._utterance.extend(frame)
+        if is_speech:
+            self._silent_frames = 0
+            return None
+
+        self._silent_frames += 1
+        if self._silent_frames <= self.threshold_silent:
+            return None
+        utterance = bytes(self._utterance)
+        self._triggered = False
+        self._silent_frames = 0
+        self._utterance = bytearray()
+        return utterance
+
+    def feed(self, pcm: bytes) -> List[bytes]:
+        """
+        Process PCM of any length (e.g. network packets), re-framing it into
+        VAD-sized frames. Returns the utterances that ended within it.
+        """
+        self._pending.extend(pcm)
+        utterances = []
+        n = self.frame_bytes
+        full = len(self._pending) - len(self._pending) % n
+        for off in range(0, full, n):
+            utterance = self.push(bytes(self._pending[off:off + n]))
+            if utterance:
+                utterances.append(utterance)
+        del self._pending[:full]
+        return utterances
+
+    def flush(self) -> Optional[bytes]:
+        """
+        Return whatever utterance is in progress and reset.
+        """
+        utterance = bytes(self._utterance) if self._utterance else None
+        self._triggered = False
+        self._silent_frames = 0
+        self._utterance = bytearray()
+        return utterance
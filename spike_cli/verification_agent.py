@@ -1,104 +1,372 @@
 import os
-import re
 import json
+import time
 import asyncio
-from typing import Callable, Dict, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from openai import OpenAI
 
+from spike_cli.cache     import ResponseCache, history_key
+from spike_cli.router    import FAST, LARGE, ModelRouter
+from spike_cli.scheduler import ProviderScheduler, get_scheduler
+
+STATE_FIELDS = (
+    "member_id",
+    "patient_name",
+    "date_of_birth",
+    "insurance_active_to",
+    "date_of_treatment",
+    "visit_limit",
+    "visit_limit_structure",
+    "visits_used",
+    "copay",
+    "deductible",
+    "deductible_met",
+    "out_of_pocket_maximum",
+    "out_of_pocket_met",
+    "initial_authorization",
+    "reference_number",
+)
+
+# The model reports only what changed; the full state lives in VerificationAgent.
+UPDATE_STATE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "update_state",
+        "description": (
+            "Record insurance fields the rep just provided or corrected. "
+            "Include only fields that changed this turn."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {f: {"type": ["string", "null"]} for f in STATE_FIELDS},
+            "additionalProperties": False,
+        },
+    },
+}
+
+def _parse_delta(arguments: str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Parse update_state arguments and validate them against the state schema.
+    Returns None if they don't parse or name unknown fields / bad values.
+    """
+    try:
+        delta = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(delta, dict):
+        return None
+    for key, value in delta.items():
+        if key not in STATE_FIELDS or isinstance(value, bool):
+            return None
+        if value is not None and not isinstance(value, (str, int, float)):
+            return None
+    return {k: v if v is None or isinstance(v, str) else str(v) for k, v in delta.items()}
+
+# Extra completions asked for when the model answers with a state update only
+MAX_FOLLOW_UPS = 2
+
+# Output budget reserved with the scheduler until the real usage is known
+REPLY_TOKEN_BUDGET = 150
+
+def _estimate_tokens(messages: List[dict]) -> int:
+    """
+    Rough prompt + reply size (4 characters per token) for the tokens/min bucket.
+    """
+    chars = len(json.dumps(UPDATE_STATE_TOOL))
+    for m in messages:
+        chars += len(m.get("content") or "")
+        for tc in m.get("tool_calls", []):
+            chars += len(tc["function"]["arguments"])
+    return chars // 4 + 4 * len(messages) + REPLY_TOKEN_BUDGET
+
+def _assistant_message(content: str, tool_calls: List[dict]) -> dict:
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return message
+
+class _SchedulerOpenAI(OpenAI):
+    """
+    OpenAI client that keeps the SDK's retries for transient errors (timeouts,
+    5xx, ...) but leaves 429s to the shared ProviderScheduler, so the whole
+    process backs off together.
+    """
+    def _should_retry(self, response) -> bool:
+        if response.status_code == 429:
+            return False
+        return super()._should_retry(response)
+
 class VerificationAgent:
     """
     A verification agent that drives the insurance flow using GPT-4,
     supporting both synchronous and streaming interactions.
+    The model speaks in plain text and reports new fields through the
+    update_state function; the authoritative state is kept here in `state`.
+    Each turn's model is picked by a ModelRouter (fast vs large tier); a fast
+    turn whose state update fails schema validation is escalated to the large model.
+    Turns fully determined by (model, prompt, state), e.g. the opener, are
+    served from a ResponseCache keyed on the normalized history.
+    Requests go through the process-wide "openai" ProviderScheduler.
 
     Methods:
-    - process(user_input) -> (full_reply: str, new_state: dict)
-    - stream(user_input, nl_callback, state_callback) -> async
+    - process(user_input) -> (reply: str, changed_fields: dict)
+    - stream(user_input, nl_callback, state_callback, reply_callback) -> async
     """
-    def __init__(self, config: dict):
+    def __init__(
+        self,
+        config: dict,
+        router: Optional[ModelRouter] = None,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[ProviderScheduler] = None
+    ):
         api_key = os.getenv("OPENAI_API_KEY", "").strip()
         if not api_key:
             raise ValueError("Missing OPENAI_API_KEY")
-        self.client = OpenAI(api_key=api_key)
+        self.client = _SchedulerOpenAI(api_key=api_key)
         tpl     = config["agent"]["system_prompt_template"]
         patient = config["patient"]
         system_prompt = tpl.format(**patient)
 
-        # Seed initial JSON state
-        self.initial_state = {
-            "member_id":             patient["member_id"],
-            "patient_name":          patient["patient_name"],
-            "date_of_birth":         patient["date_of_birth"],
-            "insurance_active_to":   None,
-            "date_of_treatment":     None,
-            "visit_limit":           None,
-            "visit_limit_structure": None,
-            "visits_used":           None,
-            "copay":                 None,
-            "deductible":            None,
-            "deductible_met":        None,
-            "out_of_pocket_maximum": None,
-            "out_of_pocket_met":     None,
-            "initial_authorization": None,
-            "reference_number":      None
-        }
-        # Build conversation history with a pseudo-turn to prompt first question
+        # Seed initial state: known patient fields, everything else missing
+        self.initial_state = {f: None for f in STATE_FIELDS}
+        self.initial_state.update({
+            "member_id":     patient["member_id"],
+            "patient_name":  patient["patient_name"],
+            "date_of_birth": patient["date_of_birth"],
+        })
+        # Conversation history starts from the prompt and the known state
         self.history = [
-            {"role": "system",    "content": system_prompt},
-            {"role": "assistant", "content": f"```json\n{json.dumps(self.initial_state)}\n```"}
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": f"Known state (null = still missing): {json.dumps(self.initial_state)}"}
         ]
-        self.model = config["agent"]["model"]
+        self.model  = config["agent"]["model"]
+        self.router = router or ModelRouter(config)
+        self.cache  = cache or ResponseCache.from_config(config, "llm")
+        self.state  = self.initial_state.copy()
+        self.scheduler = scheduler or get_scheduler("openai")
 
-    def process(self, rep_utterance: str) -> Tuple[str, Dict[str, str]]:
+    def _deterministic(self) -> bool:
         """
-        Synchronous call: send user input and return the full assistant message plus any updated JSON state.
+        True while the rep hasn't said anything: the next reply then depends
+        only on the model, the prompt template and the seeded state.
         """
-        self.history.append({"role": "user", "content": rep_utterance})
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.history
+        return not any(m["role"] == "user" and m["content"].strip() for m in self.history)
+
+    def _missing(self) -> List[str]:
+        return [k for k, v in self.state.items() if v is None]
+
+    def _complete(self, tier: str) -> Tuple[dict, float, int]:
+        """
+        Blocking completion on the given tier: returns (assistant message, seconds, output tokens).
+        """
+        started = time.perf_counter()
+        estimate = _estimate_tokens(self.history)
+        resp = self.scheduler.call(
+            self.client.chat.completions.create,
+            model=self.router.models[tier],
+            messages=self.history,
+            tools=[UPDATE_STATE_TOOL],
+            tokens=estimate
         )
-        assistant_msg = resp.choices[0].message.content
-        self.history.append({"role": "assistant", "content": assistant_msg})
-        new_state = {}
-        match = re.search(r"```json\s*(\{.*?\})\s*```", assistant_msg, flags=re.S)
-        if match:
-            try:
-                new_state = json.loads(match.group(1))
-            except json.JSONDecodeError:
-                pass
-        return assistant_msg, new_state
+        msg = resp.choices[0].message
+        tool_calls = [
+            {"id": tc.id, "type": "function",
+             "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+            for tc in (msg.tool_calls or [])
+        ]
+        usage = getattr(resp, "usage", None)
+        tokens = usage.completion_tokens if usage else 0
+        if usage:
+            self.scheduler.charge(usage.total_tokens - estimate)
+        return _assistant_message(msg.content or "", tool_calls), time.perf_counter() - started, tokens
+
+    def _delta(self, message: dict) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Merged, validated fields from the message's update_state calls
+        ({} if there are none); None if any call is invalid.
+        """
+        delta = {}
+        for tc in message.get("tool_calls", []):
+            if tc["function"]["name"] != "update_state":
+                return None
+            part = _parse_delta(tc["function"]["arguments"])
+            if part is None:
+                return None
+            delta.update(part)
+        return delta
+
+    def _commit(self, message: dict, delta: Optional[dict]) -> Dict[str, Optional[str]]:
+        """
+        Record the assistant turn and its tool results, and apply the delta.
+        """
+        self.history.append(message)
+        if delta:
+            self.state.update(delta)
+        result = {"missing": self._missing()} if delta is not None else {"error": "invalid fields, nothing recorded"}
+        for tc in message.get("tool_calls", []):
+            self.history.append({"role": "tool", "tool_call_id": tc["id"], "content": json.dumps(result)})
+        return delta or {}
+
+    def _respond(self, tier: str) -> Tuple[dict, Optional[Dict[str, Optional[str]]], str]:
+        """
+        One assistant message for the current history (cache, model, escalation);
+        returns it with its delta and the tier that produced it.
+        """
+        key = history_key(self.router.models[tier], self.history) if self._deterministic() else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            message = json.loads(cached)
+            return message, self._delta(message), tier
+        message, elapsed, tokens = self._complete(tier)
+        delta = self._delta(message)
+        if tier == FAST and delta is None:
+            self.router.record(FAST, elapsed, escalated=True, output_tokens=tokens)
+            tier = LARGE
+            message, elapsed, tokens = self._complete(tier)
+            delta = self._delta(message)
+        self.router.record(tier, elapsed, output_tokens=tokens)
+        if key and delta is not None:
+            self.cache.put(key, json.dumps(message).encode())
+        return message, delta, tier
+
+    @staticmethod
+    def _needs_follow_up(message: dict) -> bool:
+        # a message that only updated the state still owes the rep a question
+        return bool(message.get("tool_calls")) and not message["content"].strip()
+
+    def process(self, rep_utterance: str) -> Tuple[str, Dict[str, Optional[str]]]:
+        """
+        Synchronous call: send user input and return the assistant's reply plus the fields it changed.
+        """
+        tier = self.router.route(rep_utterance, self.state)
+        self.history.append({"role": "user", "content": rep_utterance})
+
+        changed = {}
+        for _ in range(1 + MAX_FOLLOW_UPS):
+            # after an escalation, follow-ups stay on the large model
+            message, delta, tier = self._respond(tier)
+            changed.update(self._commit(message, delta))
+            if not self._needs_follow_up(message):
+                break
+        return message["content"], changed
 
     async def stream(
         self,
         rep_utterance: str,
         nl_callback: Callable[[str], None],
-        state_callback: Callable[[Dict[str, str]], None]
+        state_callback: Callable[[Dict[str, Optional[str]]], None],
+        reply_callback: Optional[Callable[[str], None]] = None
     ) -> None:
         """
-        Streaming call: streams assistant tokens to `nl_callback`, then extracts JSON and calls `state_callback`.
+        Streaming call: streams assistant tokens to `nl_callback`, hands the complete
+        spoken reply to `reply_callback` as soon as the model moves on to its state
+        update, and calls `state_callback` with the changed fields (if any).
+        A state-only answer gets a follow-up request for the spoken reply.
+        `reply_callback` runs on a worker thread, so speaking the reply (TTS,
+        playback) doesn't keep the LLM scheduler slot busy; it finishes before
+        `state_callback` is called.
         """
+        tier = self.router.route(rep_utterance, self.state)
         # Append user turn
         self.history.append({"role": "user", "content": rep_utterance})
-        # Start streaming completion
-        stream = self.client.chat.completions.create(
-            model=self.model,
+        loop = asyncio.get_running_loop()
+        speaking = []
+        def speak(text: str):
+            if reply_callback:
+                speaking.append(loop.run_in_executor(None, reply_callback, text))
+        for _ in range(1 + MAX_FOLLOW_UPS):
+            message, new_state, tier = self._stream_once(tier, nl_callback, speak)
+            while speaking:
+                await speaking.pop(0)
+            # Record the turn and report what changed
+            new_state = self._commit(message, new_state)
+            if new_state:
+                state_callback(new_state)
+            if not self._needs_follow_up(message):
+                break
+
+    def _stream_once(
+        self,
+        tier: str,
+        nl_callback: Callable[[str], None],
+        reply_callback: Optional[Callable[[str], None]]
+    ) -> Tuple[dict, Optional[Dict[str, Optional[str]]], str]:
+        """
+        Stream one assistant message for the current history; returns it with
+        its delta and the tier that produced it.
+        """
+        started = time.perf_counter()
+        estimate = _estimate_tokens(self.history)
+        # Collect chunks and join once, rather than re-copying the text per token
+        parts = []
+        calls = {}
+        spoken = None
+        tokens = 0
+        # Start streaming completion; the scheduler slot is held until the
+        # last chunk has been read
+        with self.scheduler.streaming(
+            self.client.chat.completions.create,
+            model=self.router.models[tier],
             messages=self.history,
-            stream=True
-        )
-        # Buffer to accumulate full assistant text
-        buffer = ""
-        # Iterate over streamed chunks
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content
-            if delta:
-                nl_callback(delta)
-                buffer += delta
-        # Append full reply to history
-        self.history.append({"role": "assistant", "content": buffer})
-        # Extract and report new JSON state
-        match = re.search(r"```json\s*(\{.*?\})\s*```", buffer, flags=re.S)
-        if match:
-            try:
-                state_callback(json.loads(match.group(1)))
-            except json.JSONDecodeError:
-                pass
+            tools=[UPDATE_STATE_TOOL],
+            stream=True,
+            stream_options={"include_usage": True},
+            tokens=estimate
+        ) as stream:
+            # Iterate over streamed chunks
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    tokens = usage.completion_tokens
+                    self.scheduler.charge(usage.total_tokens - estimate)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    nl_callback(delta.content)
+                    parts.append(delta.content)
+                if delta.tool_calls:
+                    if spoken is None:
+                        # text is done; speak it while the state update streams in
+                        spoken = "".join(parts)
+                        if reply_callback and spoken.strip():
+                            reply_callback(spoken.strip())
+                    for tc in delta.tool_calls:
+                        call = calls.setdefault(tc.index, {"id": None, "name": "", "arguments": []})
+                        if tc.id:
+                            call["id"] = tc.id
+                        if tc.function and tc.function.name:
+                            call["name"] += tc.function.name
+                        if tc.function and tc.function.arguments:
+                            call["arguments"].append(tc.function.arguments)
+        if spoken is None:
+            spoken = "".join(parts)
+            if reply_callback and spoken.strip():
+                reply_callback(spoken.strip())
+
+        message = _assistant_message(spoken, [
+            {"id": c["id"], "type": "function",
+             "function": {"name": c["name"], "arguments": "".join(c["arguments"])}}
+            for _, c in sorted(calls.items())
+        ])
+        new_state = self._delta(message)
+
+        if tier == FAST and new_state is None:
+            # The spoken part has already gone out; ask the large model for the
+            # turn again and keep only its state update, so history stays what was said.
+            self.router.record(FAST, time.perf_counter() - started, escalated=True, output_tokens=tokens)
+            tier = LARGE
+            large, elapsed, tokens = self._complete(tier)
+            self.router.record(tier, elapsed, output_tokens=tokens)
+            if not spoken.strip():
+                # nothing was said yet, so the large model's reply can still go out
+                spoken = large["content"]
+                if spoken.strip():
+                    nl_callback(spoken)
+                    if reply_callback:
+                        reply_callback(spoken.strip())
+            message = _assistant_message(spoken, large.get("tool_calls", []))
+            new_state = self._delta(message)
+        else:
+            self.router.record(tier, time.perf_counter() - started, output_tokens=tokens)
+        return message, new_state, tier
@@ -0,0 +1,14 @@
+import io
+import wave
+
+def encode_wav(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    """
+    Wrap raw 16-bit mono PCM in a WAV container.
+    """
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
@@ -8,6 +8,15 @@ if str(ROOT) not in sys.path:
 
 import spike_cli.stt as stt_mod
 
+def pytest_addoption(parser):
+    group = parser.getgroup("bench", "hot-path microbenchmarks")
+    group.addoption("--bench", action="store_true",
+                    help="run the microbenchmarks against tests/bench_baselines.json")
+    group.addoption("--bench-update", action="store_true",
+                    help="re-record tests/bench_baselines.json from this machine")
+    group.addoption("--bench-tolerance", type=float, default=2.0,
+                    help="fail when a path is slower than baseline * tolerance (default 2.0)")
+
 @pytest.fixture(autouse=True)
 def stub_deepgram(monkeypatch):
     """
@@ -0,0 +1,45 @@
+import pytest
+from types import SimpleNamespace as NS
+from spike_cli.audio_engine import DuplexAudioEngine
+
+def run_callback(engine, indata=None):
+    outdata = bytearray(engine.block_bytes)
+    engine._callback(indata or bytes(engine.block_bytes), outdata, engine.blocksize, None, None)
+    return bytes(outdata)
+
+def test_playback_blocks_then_silence():
+    engine = DuplexAudioEngine(samplerate=1000, blocksize=2)  # 4-byte blocks
+    engine.write(b"\x01\x02\x03")                 # less than a block: held back
+    assert run_callback(engine) == b"\x00" * 4
+    engine.write(b"\x04\x05\x06", final=True)      # one full block + padded tail
+
+    assert run_callback(engine) == b"\x01\x02\x03\x04"
+    assert run_callback(engine) == b"\x05\x06\x00\x00"
+    assert run_callback(engine) == b"\x00" * 4
+    assert engine._blocks_played == engine._blocks_written == 2
+    assert engine.clock() == 4 * 2 / 1000
+
+def test_capture_is_gated_without_touching_the_stream():
+    engine = DuplexAudioEngine(samplerate=1000, blocksize=2)
+    captured = []
+    engine.set_input_handler(captured.append)
+
+    run_callback(engine, b"\x01" * 4)
+    engine.capturing = False
+    run_callback(engine, b"\x02" * 4)
+    engine.capturing = True
+    run_callback(engine, b"\x03" * 4)
+
+    assert captured == [b"\x01" * 4, b"\x03" * 4]
+
+def test_play_fails_instead_of_hanging_on_a_dead_stream():
+    engine = DuplexAudioEngine(samplerate=1000, blocksize=2)
+    # stream that is running but never calls back
+    engine._stream = NS(active=True, latency=(0.0, 0.0))
+    with pytest.raises(RuntimeError, match="stalled"):
+        engine.play(b"\x01" * 40, margin=0.05)
+    assert engine._blocks_written == engine._blocks_played and not engine._out
+
+    engine._stream = NS(active=False, latency=(0.0, 0.0))
+    with pytest.raises(RuntimeError, match="stopped"):
+        engine.play(b"\x01" * 40)
@@ -0,0 +1,165 @@
+"""
+Microbenchmarks for the per-frame and per-token hot paths.
+
+Skipped by default. Run with:
+
+    python -m pytest tests/test_benchmarks.py --bench
+    python -m pytest tests/test_benchmarks.py --bench-update   # re-record baselines
+
+Baselines are machine-specific (µs per op, best of several repeats); re-record
+them on the machine that gates regressions.
+"""
+import asyncio
+import json
+import timeit
+from pathlib import Path
+import pytest
+import webrtcvad
+
+BASELINES = Path(__file__).parent / "bench_baselines.json"
+REPEAT    = 7
+
+@pytest.fixture(scope="session")
+def bench_results(request):
+    results = {}
+    yield results
+    if request.config.getoption("--bench-update") and results:
+        data = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+        data.update(results)
+        BASELINES.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+@pytest.fixture
+def bench(request, bench_results):
+    cfg = request.config
+    update = cfg.getoption("--bench-update")
+    if not (cfg.getoption("--bench") or update):
+        pytest.skip("microbenchmarks run only with --bench / --bench-update")
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    tolerance = cfg.getoption("--bench-tolerance")
+
+    def run(name: str, fn):
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()  # also serves as warm-up
+        best = min(timer.repeat(number=number, repeat=REPEAT)) / number
+        us_per_op = round(best * 1e6, 3)
+        bench_results[name] = {"us_per_op": us_per_op}
+        if update:
+            return us_per_op
+        if name not in baselines:
+            pytest.fail(f"no baseline for {name!r}; record one with --bench-update")
+        limit = baselines[name]["us_per_op"] * tolerance
+        assert us_per_op <= limit, (
+            f"{name}: {us_per_op:.1f}µs/op exceeds baseline "
+            f"{baselines[name]['us_per_op']:.1f}µs × {tolerance}"
+        )
+        return us_per_op
+
+    return run
+
+def test_bench_recorder_segmentation(monkeypatch, bench):
+    from spike_cli.recorder import Recorder
+
+    class DummyVad:
+        def __init__(self, *args): pass
+        def is_speech(self, frame, sample_rate):
+            return frame[0] == 1
+
+    monkeypatch.setattr(webrtcvad, "Vad", DummyVad)
+    rec = Recorder(samplerate=16000, frame_duration=30)
+    speech  = b"\x01" * (rec.frame_size * 2)
+    silence = b"\x00" * (rec.frame_size * 2)
+    utterances = 10
+    # 10 speech frames followed by enough silence to close each utterance
+    frames = ([speech] * 10 + [silence] * 21) * utterances
+
+    def run():
+        emitted = []
+        def cb(utt):
+            emitted.append(utt)
+            if len(emitted) == utterances:
+                rec._running = False
+        for f in frames:
+            rec._audio_queue.put(f)
+        rec._running = True
+        rec._process_audio(cb)
+        assert len(emitted) == utterances
+
+    bench("recorder.process_audio[310 frames]", run)
+
+def test_bench_stt_wav_wrap(bench):
+    from spike_cli.stt import DeepgramSTT
+
+    dg = DeepgramSTT(sample_rate=16000)
+    pcm = b"\x00\x01" * 16000 * 5  # 5 s of audio
+
+    bench("stt.to_wav[5s]", lambda: dg._to_wav(pcm))
+
+def test_bench_player_buffering(bench):
+    from spike_cli.audio_engine import DuplexAudioEngine
+
+    engine = DuplexAudioEngine(samplerate=16000, blocksize=480)
+    pcm = b"\x00\x01" * 16000 * 5
+
+    def run():
+        engine.write(pcm, final=True)
+        engine._out.clear()
+
+    bench("player.queue_blocks[5s]", run)
+
+def test_bench_agent_delta_parsing(bench):
+    from spike_cli.verification_agent import _parse_delta
+
+    args = json.dumps({"copay": "$20", "deductible": "$500"})
+
+    def run():
+        assert _parse_delta(args) == {"copay": "$20", "deductible": "$500"}
+
+    bench("agent.parse_delta[2 fields]", run)
+
+def test_bench_stream_token_path(bench):
+    from types import SimpleNamespace as NS
+    from spike_cli.verification_agent import VerificationAgent
+
+    config = {
+        "agent":   {"system_prompt_template": "Bot for {patient_name}", "model": "gpt-4"},
+        "patient": {"member_id": "A1", "patient_name": "Testy", "date_of_birth": "Jan 1 2000"},
+    }
+    reply = "Thank you, that's very helpful. " * 8 + "Could you tell me the copay?"
+    args  = json.dumps({"deductible": "$500", "deductible_met": "$120"})
+    # roughly token-sized pieces, as the streaming API delivers them
+    chunks = [
+        NS(usage=None, choices=[NS(delta=NS(content=reply[i:i + 4], tool_calls=None))])
+        for i in range(0, len(reply), 4)
+    ] + [
+        NS(usage=None, choices=[NS(delta=NS(content=None, tool_calls=[
+            NS(index=0, id="call_1" if i == 0 else None,
+               function=NS(name="update_state" if i == 0 else None, arguments=args[i:i + 4]))
+        ]))])
+        for i in range(0, len(args), 4)
+    ]
+
+    class Client:
+        chat = completions = property(lambda self: self)
+        def create(self, **kwargs):
+            return iter(chunks)
+
+    agent = VerificationAgent(config)
+    agent.client = Client()
+    seed = agent.history[:]
+    tokens = []
+
+    loop = asyncio.new_event_loop()
+
+    def run():
+        agent.history = seed[:]
+        tokens.clear()
+        # no reply_callback: speaking hops to a thread once per turn, not per token
+        loop.run_until_complete(agent.stream(
+            "It's five hundred, and one twenty met.", tokens.append, lambda changed: None
+        ))
+
+    try:
+        bench("agent.stream_tokens[~80 chunks]", run)
+    finally:
+        loop.close()
+    assert "".join(tokens).endswith("copay?")
@@ -0,0 +1,28 @@
+from spike_cli.cache import ResponseCache, audio_key, history_key
+
+def test_history_key_normalizes_whitespace():
+    a = [{"role": "system", "content": "You are   a bot\n for Testy"}, {"role": "user", "content": ""}]
+    b = [{"role": "system", "content": "You are a bot for Testy "},  {"role": "user", "content": ""}]
+    assert history_key("gpt-4", a) == history_key("gpt-4", b)
+    assert history_key("gpt-4", a) != history_key("gpt-4o-mini", a)
+    assert audio_key("Hello there", "v1") != audio_key("Hello there", "v2")
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.get("a")
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_disk_entries_survive_restart(tmp_path):
+    ResponseCache(directory=tmp_path).put("k", b"opener")
+    assert ResponseCache(directory=tmp_path).get("k") == b"opener"
+    assert [p.name for p in tmp_path.iterdir()] == ["k.bin"]  # no temp files left behind
+
+def test_from_config_namespaces(tmp_path):
+    cache = ResponseCache.from_config({"cache": {"dir": str(tmp_path)}}, "tts")
+    assert cache.directory == tmp_path / "tts"
+    assert ResponseCache.from_config({}, "tts").directory is None
@@ -0,0 +1,6 @@
+from spike_cli.dialogue import is_farewell
+
+def test_is_farewell():
+    assert is_farewell("Thanks so much, goodbye.")
+    assert is_farewell("Have a great day!")
+    assert not is_farewell("What is the copay?")
@@ -0,0 +1,131 @@
+import io
+import multiprocessing as mp
+import threading
+import time
+import wave
+from multiprocessing import shared_memory
+import pytest
+from spike_cli.dsp_pool import DSPPool, ShmRing
+from spike_cli.server import spawn_worker
+
+FRAME = 960  # 30 ms at 16 kHz, 16-bit
+
+class DummyVad:
+    """Module-level so spawned workers can unpickle it."""
+    def __init__(self, *args): pass
+    def is_speech(self, frame, sample_rate):
+        return frame[0] == 1
+
+def test_ring_wraps_around():
+    shm = shared_memory.SharedMemory(create=True, size=8)
+    try:
+        ring = ShmRing(shm, 8)
+        ring.write(0, b"abcdef")
+        ring.write(6, b"ghij")           # wraps: ij land at the start
+        assert ring.read(2, 10) == b"cdefghij"
+        ring.release()
+    finally:
+        shm.unlink()
+
+SPEECH = b"\x01" * FRAME * 5 + b"\x00" * FRAME * 21
+
+def speak(call):
+    for off in range(0, len(SPEECH), 640):  # 20 ms packets
+        call.write(SPEECH[off:off + 640])
+    call.write(b"\x00" * FRAME * 3)         # push past the notify threshold
+
+def test_pool_segments_and_encodes_in_workers():
+    pool = DSPPool(workers=2, in_seconds=1, out_seconds=5, vad_factory=DummyVad)
+    pool.start()
+    try:
+        got = []
+        done = threading.Event()
+        def on_utt(wav):
+            got.append(wav)
+            if len(got) == 2:
+                done.set()
+
+        calls = [pool.open_call(on_utt) for _ in range(2)]
+        assert {c.worker for c in calls} == {0, 1}   # sharded across workers
+
+        for call in calls:
+            speak(call)
+        assert done.wait(timeout=30)
+
+        with wave.open(io.BytesIO(got[0]), "rb") as wf:
+            assert wf.getframerate() == 16000
+            assert wf.readframes(wf.getnframes()).startswith(b"\x01" * FRAME * 5)
+        assert pool.stats()["utterances"] == 2
+    finally:
+        pool.close()
+    assert pool.stats()["calls"] == 0
+
+def test_dead_worker_is_respawned_and_its_calls_reopened():
+    pool = DSPPool(workers=1, in_seconds=1, out_seconds=5, vad_factory=DummyVad)
+    pool.start()
+    try:
+        got = threading.Event()
+        call = pool.open_call(lambda wav: got.set())
+        pool._procs[0].kill()
+        pool._procs[0].join()
+
+        deadline = threading.Event()
+        while not pool.stats()["restarts"] and not deadline.wait(0.05):
+            pass
+        speak(call)
+        assert got.wait(timeout=30)
+        assert pool.stats()["restarts"] == 1
+    finally:
+        pool.close()
+
+def test_close_unlinks_calls_of_a_dead_worker():
+    pool = DSPPool(workers=1, in_seconds=1, out_seconds=5, vad_factory=DummyVad)
+    pool.start()
+    call = pool.open_call(lambda wav: None)
+    names = [call.in_ring.shm.name, call.out_ring.shm.name]
+    pool._closing = True   # keep the worker dead
+    pool._procs[0].kill()
+    pool._procs[0].join()
+    pool.close()
+
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+def _pool_in_worker(results):
+    pool = DSPPool(workers=1, in_seconds=1, out_seconds=5, vad_factory=DummyVad)
+    pool.start()
+    got = threading.Event()
+    speak(pool.open_call(lambda wav: got.set()))
+    results.put(got.wait(timeout=30))
+    pool.close()
+
+def test_pool_starts_inside_a_server_worker():
+    results = mp.get_context("spawn").Queue()
+    worker = spawn_worker(_pool_in_worker, results)
+    assert results.get(timeout=60) is True
+    worker.join(timeout=30)
+    assert worker.exitcode == 0
+
+def test_dead_worker_is_noticed_while_results_keep_flowing():
+    pool = DSPPool(workers=1, in_seconds=1, out_seconds=5, vad_factory=DummyVad, check_s=0.2)
+    pool.start()
+    stop = threading.Event()
+    def chatter():
+        # results for an unknown call, more often than the liveness timer
+        while not stop.wait(0.02):
+            pool._results.put(("closed", -1))
+    noise = threading.Thread(target=chatter, daemon=True)
+    noise.start()
+    try:
+        pool._procs[0].kill()
+        pool._procs[0].join()
+        for _ in range(100):
+            if pool.stats()["restarts"]:
+                break
+            time.sleep(0.05)
+        assert pool.stats()["restarts"] == 1
+    finally:
+        stop.set()
+        noise.join()
+        pool.close()
@@ -30,4 +30,12 @@ def test_vad_segment(monkeypatch):
     rec._process_audio(cb)
 
     # 6) We should have exactly one segment: the two b"\x01" and two b"\x00" frames concatenated as the threshold is one frame of silence, thus two exceeds it so the last two get cut
-    assert segments == [b"\x01\x01\x00\x00"]
\ No newline at end of file
+    assert segments == [b"\x01\x01\x00\x00"]
+
+def test_enqueue_reframes_engine_blocks():
+    rec = Recorder(samplerate=16000, frame_duration=30)
+    # engine blocks of 20 ms vs 30 ms VAD frames
+    for _ in range(3):
+        rec._enqueue(b"\x00" * 640)
+    frames = [rec._audio_queue.get_nowait() for _ in range(rec._audio_queue.qsize())]
+    assert frames == [b"\x00" * rec.frame_bytes, b"\x00" * rec.frame_bytes]
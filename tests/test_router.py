@@ -0,0 +1,32 @@
+from spike_cli.router import FAST, LARGE, ModelRouter
+
+def make_router(**routing):
+    return ModelRouter({"agent": {"model": "gpt-4", "routing": {"fast_model": "gpt-4o-mini", **routing}}})
+
+def test_route_policy():
+    router = make_router()
+    state = {"copay": None, "deductible": None, "visit_limit": None}
+
+    assert router.route("", state) == LARGE                                  # opener
+    assert router.route("The copay is twenty dollars.", state) == FAST       # slot filling
+    assert router.route("Which visit limit do you mean?", state) == LARGE    # question back
+    assert router.route("Hmm, I think it depends on the plan.", state) == LARGE
+    assert router.route("It's 500.", {"copay": "$20", "deductible": None}) == LARGE  # recap
+
+def test_single_model_disables_tiering():
+    router = ModelRouter({"agent": {"model": "gpt-4"}})
+    assert router.models == {FAST: "gpt-4", LARGE: "gpt-4"}
+    assert router.route("The copay is twenty dollars.", {"copay": None, "x": None}) == LARGE
+
+def test_metrics_track_escalations():
+    router = make_router()
+    router.record(FAST, 0.2)
+    router.record(FAST, 0.4, escalated=True)
+    router.record(LARGE, 1.5)
+
+    m = router.metrics()
+    assert m[FAST]["model"] == "gpt-4o-mini"
+    assert m[FAST]["turns"] == 2
+    assert m[FAST]["escalation_rate"] == 0.5
+    assert m[FAST]["mean_s"] == 0.3
+    assert m[LARGE]["p95_s"] == 1.5
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from spike_cli.scheduler import (
+    BATCH, LIVE, ProviderScheduler, RateLimited, TokenBucket, batch_priority,
+    configure, get_scheduler
+)
+
+class TooManyRequests(Exception):
+    status_code = 429
+
+def test_token_bucket_delay():
+    bucket = TokenBucket(rate=10, capacity=10)
+    now = time.monotonic()
+    assert bucket.delay(10, now) == 0
+    bucket.take(10, now)
+    assert bucket.delay(5, now) == pytest.approx(0.5, abs=0.01)
+    # larger than the bucket: wait for a full bucket, never forever
+    assert bucket.delay(50, now) == pytest.approx(1.0, abs=0.01)
+
+def test_live_requests_overtake_queued_batch():
+    sched = ProviderScheduler("test", max_concurrent=1)
+    order = []
+    sched.acquire()  # occupy the only slot so everything else queues
+
+    def worker(name, priority):
+        with sched.slot(priority=priority):
+            order.append(name)
+
+    threads = [threading.Thread(target=worker, args=("batch", BATCH))]
+    threads[0].start()
+    while sched.stats()["queued"] < 1:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=worker, args=("live", LIVE)))
+    threads[1].start()
+    while sched.stats()["queued"] < 2:
+        time.sleep(0.001)
+
+    sched.release()
+    for t in threads:
+        t.join(timeout=2)
+    assert order == ["live", "batch"]
+    stats = sched.stats()["priorities"]
+    assert stats["live"]["requests"] == 2 and stats["batch"]["requests"] == 1
+    assert stats["batch"]["wait_seconds_total"] > 0
+
+def test_requests_per_second_spaces_requests():
+    sched = ProviderScheduler("test", requests_per_second=20)
+    started = time.monotonic()
+    for _ in range(25):  # 20 burst, then 5 at 50 ms each
+        with sched.slot():
+            pass
+    assert time.monotonic() - started >= 0.2
+
+def test_call_retries_rate_limits():
+    sched = ProviderScheduler("test", max_retries=2, backoff_s=0.01)
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TooManyRequests()
+        return "ok"
+
+    assert sched.call(flaky) == "ok"
+    assert sched.stats()["throttled"] == 2
+
+    with pytest.raises(RateLimited):
+        sched.call(lambda: (_ for _ in ()).throw(TooManyRequests()))
+    assert sched.stats()["failed"] == 1
+    with pytest.raises(ValueError):  # other errors are not retried
+        sched.call(lambda: int("x"))
+
+def test_async_call_respects_batch_priority():
+    sched = ProviderScheduler("test", max_retries=1, backoff_s=0.01)
+    async def transcribe():
+        return "hello"
+    async def run():
+        with batch_priority():
+            return await sched.call_async(transcribe)
+
+    assert asyncio.run(run()) == "hello"
+    assert sched.stats()["priorities"]["batch"]["requests"] == 1
+    assert sched.stats()["in_flight"] == 0
+
+def test_configure_splits_quota_across_workers():
+    configure({"limits": {"test-provider": {"tokens_per_minute": 6000, "max_concurrent": 8}}}, share=4)
+    sched = get_scheduler("test-provider")
+    assert sched.tokens_per_minute == 1500
+    assert sched.max_concurrent == 2
+    assert sched.requests_per_second is None
+
+def test_uneven_concurrency_split_stays_within_quota():
+    limits = {"limits": {"test-uneven": {"max_concurrent": 5}}}
+    slots = []
+    for index in range(3):
+        configure(limits, share=3, index=index)
+        slots.append(get_scheduler("test-uneven").max_concurrent)
+    assert slots == [2, 2, 1]
+
+    with pytest.raises(ValueError, match="server workers"):
+        configure(limits, share=16)
+
+def test_streaming_holds_the_slot_until_the_block_ends():
+    sched = ProviderScheduler("test", max_concurrent=1, backoff_s=0.01)
+    attempts = []
+    def open_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise TooManyRequests()
+        return iter(["a", "b"])
+
+    with sched.streaming(open_stream) as stream:
+        for _ in stream:
+            assert sched.stats()["in_flight"] == 1
+    assert sched.stats()["in_flight"] == 0
+    assert sched.stats()["throttled"] == 1
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import re
+import pytest
+import pytest_asyncio
+import webrtcvad
+from aiohttp import WSMsgType
+from aiohttp.test_utils import TestClient, TestServer
+from spike_cli.dsp_pool import DSPPool
+from spike_cli.scheduler import get_scheduler
+from spike_cli.server import CACHE_KEY, METRICS_KEY, PREFETCH_KEY, TTS_KEY, create_app, drain
+
+pytest_plugins = ("pytest_asyncio",)
+
+FRAME = 960  # 30 ms at 16 kHz, 16-bit
+
+class DummyVad:
+    def __init__(self, *args): pass
+    def is_speech(self, frame, sample_rate):
+        return frame[0] == 1
+
+class DummySTT:
+    async def transcribe(self, audio_bytes):
+        return "The copay is twenty dollars."
+    async def transcribe_wav(self, wav):
+        assert wav[:4] == b"RIFF"
+        return "The copay is twenty dollars."
+
+class DummyTTS:
+    def __init__(self):
+        self.cached = {}
+    def synthesize(self, text, cacheable=False):
+        audio = b"\x00\x00" * 100
+        if cacheable:
+            self.cached[text] = audio
+        return audio
+
+class DummyAgent:
+    def __init__(self, config, router=None, cache=None):
+        self.initial_state = {"member_id": config["patient"]["member_id"]}
+        self.member_id = config["patient"]["member_id"]
+        self.cache = cache
+        self.scheduler = get_scheduler("dummy-llm")
+        self.turns = []
+    def process(self, rep):
+        return self.scheduler.call(self._reply, rep)
+    def _reply(self, rep):
+        self.turns.append(rep)
+        if not rep:
+            # like VerificationAgent, the opener lands in the shared LLM cache
+            self.cache.put(self.member_id, b"Hello, what is the copay?")
+            return "Hello, what is the copay?", {}
+        return "Thanks, goodbye.", {"copay": "$20"}
+
+@pytest.fixture
+def config():
+    return {
+        "agent":    {"model": "gpt-4"},
+        "patient":  {"member_id": "ABC123", "patient_name": "Testy", "date_of_birth": "Jan 1 2000"},
+        "recorder": {"samplerate": 16000, "frame_duration": 30},
+    }
+
+@pytest_asyncio.fixture
+async def client(request, monkeypatch, config):
+    monkeypatch.setattr(webrtcvad, "Vad", DummyVad)
+    pool = None
+    if getattr(request, "param", None) == "dsp-pool":
+        pool = DSPPool(workers=1, notify_ms=30, vad_factory=DummyVad)
+        pool.start()
+    app = create_app(config, stt=DummySTT(), tts=DummyTTS(), agent_factory=DummyAgent, dsp_pool=pool)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield client
+    await client.close()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("client", ["in-process", "dsp-pool"], indirect=True)
+async def test_call_session_round_trip(client):
+    ws = await client.ws_connect("/ws?member_id=XYZ")
+    events, audio = [], 0
+
+    start = await ws.receive_json()
+    assert start["state"] == {"member_id": "XYZ"}
+
+    # one utterance: speech followed by enough silence to close it
+    await ws.send_bytes(b"\x01" * FRAME * 5 + b"\x00" * FRAME * 21)
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            audio += len(msg.data)
+        elif msg.type == WSMsgType.TEXT:
+            events.append(json.loads(msg.data))
+
+    assert [e["type"] for e in events] == ["reply", "transcript", "reply", "state", "hangup"]
+    assert events[1]["text"] == "The copay is twenty dollars."
+    assert events[3]["state"] == {"copay": "$20"}
+    assert audio == 2 * 200
+
+    metrics = await (await client.get("/metrics")).text()
+    assert "spike_turns_total" in metrics
+    assert 'spike_llm_tier_turns{' in metrics
+    # the agent's requests went through the process-wide scheduler
+    requests = re.search(r'spike_provider_requests\{[^}]*provider="dummy-llm",priority="live"\} (\d+)', metrics)
+    assert requests and int(requests.group(1)) >= 2
+
+@pytest.mark.asyncio
+async def test_malformed_text_frames_are_ignored(client):
+    ws = await client.ws_connect("/ws")
+    await ws.receive_json()                      # start
+    for junk in ("not json", "[1]", '{"kind": "x"}'):
+        await ws.send_str(junk)
+    await ws.send_bytes(b"\x01" * FRAME * 5 + b"\x00" * FRAME * 21)
+    events = [json.loads(msg.data) async for msg in ws if msg.type == WSMsgType.TEXT]
+
+    assert events[-1]["type"] == "hangup"
+    assert client.server.app[METRICS_KEY].errors_total == 0
+
+@pytest.mark.asyncio
+async def test_drain_refuses_new_calls(client):
+    resp = await client.get("/healthz")
+    assert resp.status == 200
+
+    await drain(client.server.app, timeout=0)
+
+    assert (await client.get("/healthz")).status == 503
+    assert (await client.get("/ws")).status == 503
+
+@pytest.mark.asyncio
+async def test_prefetch_renders_opener(client):
+    app = client.server.app
+    resp = await client.post("/prefetch", json={"member_id": "NEXT1"})
+    assert resp.status == 202
+
+    # rendered in the background into the app's caches, for that patient
+    for _ in range(200):
+        if app[CACHE_KEY].get("NEXT1") is not None:
+            break
+        await asyncio.sleep(0.01)
+    assert app[CACHE_KEY].get("NEXT1") == b"Hello, what is the copay?"
+    app[PREFETCH_KEY].shutdown()  # wait for the audio half
+    assert app[TTS_KEY].cached["Hello, what is the copay?"] == b"\x00\x00" * 100
+    assert (await client.post("/prefetch", json={"foo": 1})).status == 400
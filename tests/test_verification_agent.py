@@ -1,17 +1,24 @@
 import json
-import re
+import asyncio
+import time
+import httpx
 import pytest
+from types import SimpleNamespace as NS
 from spike_cli.verification_agent import VerificationAgent
 
 
-    
+
+def tool_call(arguments, id="call_1"):
+    return NS(id=id, function=NS(name="update_state", arguments=arguments))
+
 class DummyChoice:
-    def __init__(self, content):
-        self.message = type("X", (), {"content": content})
+    def __init__(self, content, tool_calls=None):
+        self.message = NS(content=content, tool_calls=tool_calls)
 
 class DummyResp:
-    def __init__(self, content):
-        self.choices = [DummyChoice(content)]
+    def __init__(self, content, tool_calls=None):
+        self.choices = [DummyChoice(content, tool_calls)]
+        self.usage = NS(completion_tokens=12, total_tokens=400)
 
 class DummyClient:
     def __init__(self, response):
@@ -22,7 +29,7 @@ class DummyClient:
     @property
     def completions(self):
         return self
-    def create(self, model, messages, stream=False):
+    def create(self, model, messages, stream=False, **kwargs):
         return self._response
 
 @pytest.fixture
@@ -44,15 +51,222 @@ def config(tmp_path, monkeypatch):
 @pytest.fixture(autouse=True)
 def fake_openai_key(monkeypatch):
     monkeypatch.setenv("OPENAI_API_KEY", "fake-key")
-    
+
 def test_process_updates_state(monkeypatch, config):
-    state = {"member_id":"ABC123","patient_name":"Testy","date_of_birth":"Jan 1 2000","insurance_active_to":"2025-12-31"}
-    assistant_msg = f"Here it is\n```json\n{json.dumps(state)}\n```"
-    dummy_response = DummyResp(assistant_msg)
+    dummy_response = DummyResp(
+        "Thanks. What is the date of treatment?",
+        [tool_call('{"insurance_active_to": "2025-12-31"}')]
+    )
 
     agent = VerificationAgent(config)
     monkeypatch.setattr(agent, "client", DummyClient(dummy_response))
 
     reply, new_state = agent.process("hello")
-    assert "Here it is" in reply
-    assert new_state["insurance_active_to"] == "2025-12-31"
\ No newline at end of file
+    assert reply == "Thanks. What is the date of treatment?"
+    assert new_state == {"insurance_active_to": "2025-12-31"}
+    assert agent.state["insurance_active_to"] == "2025-12-31"
+    assert agent.state["member_id"] == "ABC123"
+    # the tool call is answered so the next request is well-formed
+    tool_msg = agent.history[-1]
+    assert tool_msg["role"] == "tool" and tool_msg["tool_call_id"] == "call_1"
+    assert "insurance_active_to" not in json.loads(tool_msg["content"])["missing"]
+
+def test_unknown_fields_are_rejected(monkeypatch, config):
+    agent = VerificationAgent(config)
+    monkeypatch.setattr(agent, "client", DummyClient(
+        DummyResp("Okay.", [tool_call('{"copay": "$20", "favorite_color": "blue"}')])
+    ))
+
+    _, new_state = agent.process("The copay is twenty dollars.")
+    assert new_state == {}
+    assert agent.state["copay"] is None
+
+class ModelClient(DummyClient):
+    """Answers per model, recording which models were asked."""
+    def __init__(self, by_model):
+        self._by_model = by_model
+        self.calls = []
+    def create(self, model, messages, stream=False, **kwargs):
+        self.calls.append(model)
+        return self._by_model[model]
+
+class SequenceClient(DummyClient):
+    """Answers with the given responses in order, recording the messages sent."""
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.sent = []
+    def create(self, model, messages, stream=False, **kwargs):
+        self.sent.append(list(messages))
+        return self._responses.pop(0)
+
+def test_state_only_answer_gets_a_spoken_follow_up(monkeypatch, config):
+    agent = VerificationAgent(config)
+    client = SequenceClient(
+        DummyResp(None, [tool_call('{"copay": "$20"}')]),   # no text at all
+        DummyResp("Thanks. And the deductible?"),
+    )
+    monkeypatch.setattr(agent, "client", client)
+
+    reply, new_state = agent.process("The copay is twenty dollars.")
+    assert reply == "Thanks. And the deductible?"
+    assert new_state == {"copay": "$20"}
+    # the follow-up request carries the tool result
+    assert client.sent[1][-1]["role"] == "tool"
+
+def test_invalid_fast_state_escalates(monkeypatch, config):
+    config["agent"]["routing"] = {"fast_model": "small", "large_model": "big"}
+    agent = VerificationAgent(config)
+    client = ModelClient({
+        "small": DummyResp("What is the deductible?", [tool_call('{"copay": "$20"')]),  # broken JSON
+        "big":   DummyResp("What is the deductible?", [tool_call('{"copay": "$20"}')]),
+    })
+    monkeypatch.setattr(agent, "client", client)
+
+    reply, new_state = agent.process("The copay is twenty dollars.")
+    assert client.calls == ["small", "big"]
+    assert new_state == {"copay": "$20"}
+    assert agent.state["copay"] == "$20"
+    assert agent.router.metrics()["fast"]["escalations"] == 1
+
+def test_opener_served_from_cache(monkeypatch, config):
+    client = ModelClient({"gpt-4": DummyResp("Hi, I am calling about Testy.")})
+    first = VerificationAgent(config)
+    monkeypatch.setattr(first, "client", client)
+    first.process("")
+
+    # a new call for the same patient reuses the rendered opener
+    second = VerificationAgent(config, cache=first.cache)
+    monkeypatch.setattr(second, "client", client)
+    reply, _ = second.process("")
+    assert reply == "Hi, I am calling about Testy."
+    assert client.calls == ["gpt-4"]
+
+    # once the rep has spoken, turns always go to the model
+    second.process("The plan is active.")
+    assert client.calls == ["gpt-4", "gpt-4"]
+
+def chunk(content=None, tool_calls=None):
+    return NS(usage=None, choices=[NS(delta=NS(content=content, tool_calls=tool_calls))])
+
+def test_reply_is_spoken_without_holding_the_llm_slot(monkeypatch, config):
+    chunks = [
+        chunk("What is the copay?"),
+        chunk(tool_calls=[NS(index=0, id="call_1", function=NS(name="update_state", arguments="{}"))]),
+    ]
+    agent = VerificationAgent(config)
+    monkeypatch.setattr(agent, "client", DummyClient(iter(chunks)))
+    slot_freed = []
+    def reply(text):
+        # playback outlives the stream; the slot must free up meanwhile
+        for _ in range(100):
+            if agent.scheduler.stats()["in_flight"] == 0:
+                break
+            time.sleep(0.01)
+        slot_freed.append(agent.scheduler.stats()["in_flight"] == 0)
+
+    asyncio.run(agent.stream("Hi.", lambda tok: None, lambda changed: None, reply))
+    assert slot_freed == [True]
+
+def test_stream_speaks_before_state_update(monkeypatch, config):
+    args = '{"copay": "$20", "deductible": "$500"}'
+    chunks = [
+        chunk("Thanks! "), chunk("And the visit limit?"),
+        chunk(tool_calls=[NS(index=0, id="call_9", function=NS(name="update_state", arguments=args[:10]))]),
+        chunk(tool_calls=[NS(index=0, id=None, function=NS(name=None, arguments=args[10:]))]),
+        NS(usage=NS(completion_tokens=30, total_tokens=450), choices=[]),
+    ]
+    agent = VerificationAgent(config)
+    monkeypatch.setattr(agent, "client", DummyClient(iter(chunks)))
+    events = []
+    in_flight = []
+    def on_token(tok):
+        events.append(("token", tok))
+        in_flight.append(agent.scheduler.stats()["in_flight"])
+
+    asyncio.run(agent.stream(
+        "Copay is twenty, deductible five hundred.",
+        on_token,
+        lambda changed: events.append(("state", changed)),
+        lambda text: events.append(("reply", text)),
+    ))
+
+    assert events == [
+        ("token", "Thanks! "), ("token", "And the visit limit?"),
+        ("reply", "Thanks! And the visit limit?"),
+        ("state", {"copay": "$20", "deductible": "$500"}),
+    ]
+    assert agent.router.metrics()["large"]["mean_output_tokens"] == 30
+    # the stream is read inside the scheduler slot, which is free again afterwards
+    assert in_flight == [1, 1] and agent.scheduler.stats()["in_flight"] == 0
+
+def test_stream_follows_up_a_state_only_answer(monkeypatch, config):
+    agent = VerificationAgent(config)
+    monkeypatch.setattr(agent, "client", SequenceClient(
+        iter([chunk(tool_calls=[NS(index=0, id="call_1", function=NS(name="update_state", arguments='{"copay": "$20"}'))]),
+              NS(usage=NS(completion_tokens=8, total_tokens=400), choices=[])]),
+        iter([chunk("And the deductible?"), NS(usage=NS(completion_tokens=5, total_tokens=420), choices=[])]),
+    ))
+    events = []
+
+    asyncio.run(agent.stream(
+        "Copay is twenty.",
+        lambda tok: None,
+        lambda changed: events.append(("state", changed)),
+        lambda text: events.append(("reply", text)),
+    ))
+
+    assert events == [("state", {"copay": "$20"}), ("reply", "And the deductible?")]
+
+class QueueClient(DummyClient):
+    """Answers each model from its own queue of responses, recording which models were asked."""
+    def __init__(self, by_model):
+        self._by_model = {model: list(responses) for model, responses in by_model.items()}
+        self.calls = []
+    def create(self, model, messages, stream=False, **kwargs):
+        self.calls.append(model)
+        return self._by_model[model].pop(0)
+
+def test_stream_escalation_speaks_the_large_reply(monkeypatch, config):
+    config["agent"]["routing"] = {"fast_model": "small", "large_model": "big"}
+    agent = VerificationAgent(config)
+    client = QueueClient({
+        "small": [iter([
+            chunk(tool_calls=[NS(index=0, id="call_1", function=NS(name="update_state", arguments='{"copay"'))]),
+            NS(usage=NS(completion_tokens=5, total_tokens=300), choices=[]),
+        ])],
+        "big":   [DummyResp("Got it. And the deductible?", [tool_call('{"copay": "$20"}')])],
+    })
+    monkeypatch.setattr(agent, "client", client)
+    events = []
+
+    asyncio.run(agent.stream(
+        "The copay is twenty dollars.",
+        lambda tok: None,
+        lambda changed: events.append(("state", changed)),
+        lambda text: events.append(("reply", text)),
+    ))
+
+    # fast sent only a broken tool call: the large model's reply is spoken, no follow-up
+    assert client.calls == ["small", "big"]
+    assert events == [("reply", "Got it. And the deductible?"), ("state", {"copay": "$20"})]
+
+def test_follow_ups_stay_on_the_large_model_after_escalation(monkeypatch, config):
+    config["agent"]["routing"] = {"fast_model": "small", "large_model": "big"}
+    agent = VerificationAgent(config)
+    client = QueueClient({
+        "small": [DummyResp(None, [tool_call('{"copay"')])],
+        "big":   [DummyResp(None, [tool_call('{"copay": "$20"}')]), DummyResp("And the deductible?")],
+    })
+    monkeypatch.setattr(agent, "client", client)
+
+    reply, changed = agent.process("The copay is twenty dollars.")
+    assert client.calls == ["small", "big", "big"]
+    assert reply == "And the deductible?" and changed == {"copay": "$20"}
+
+def test_sdk_retries_everything_but_rate_limits(config):
+    client = VerificationAgent(config).client
+    assert client.max_retries > 0
+    # 429 backoff belongs to the shared scheduler, transient errors to the SDK
+    assert not client._should_retry(httpx.Response(429))
+    assert client._should_retry(httpx.Response(503))
+    assert client._should_retry(httpx.Response(408))